@@ -0,0 +1,174 @@
+import asyncio
+import json
+import numbers
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+import bayes_calculations as b
+import instrumentation as instr
+
+# Inputs of an experiment, named as the arguments of bayesCalculations.setValues. The counts come first
+INPUT_NAMES = ["visitors_A", "conversions_A", "visitors_B", "conversions_B", "test_duration",
+               "percent_traffic_in_test", "aov", "min_rev_yield"]
+COUNT_NAMES = INPUT_NAMES[:4]
+PROJECTION_NAMES = INPUT_NAMES[4:]
+# Results of an experiment, the statistics of the main result and the risk assessment of the app
+RESULT_NAMES = ["control_cr", "variant_cr", "relative_difference", "prob_A", "prob_B", "prob_yield_mean",
+                "expected_risk", "expected_uplift", "total_contribution"]
+# Defaults of the experiments accepted per request, without and with histograms, and of the requests
+# evaluated at the same time. The histograms cost about 70 ms per experiment, almost all of it in the
+# Beta survival functions of the tabulated difference, which batching does not make cheaper
+MAX_EXPERIMENTS = 1000
+MAX_HISTOGRAM_EXPERIMENTS = 20
+CONCURRENCY = os.cpu_count() or 1
+
+
+def validate(experiment):
+    """
+    The INPUT_NAMES of an experiment as floats, raising ValueError for missing or impossible values.
+    Booleans are not numbers here, and the counts must be whole numbers
+    """
+    if not isinstance(experiment, dict):
+        raise ValueError("Expected an object with the values of the experiment")
+    missing = [name for name in INPUT_NAMES if name not in experiment]
+    if missing:
+        raise ValueError(f"Missing values {missing}")
+    not_numbers = [name for name in INPUT_NAMES if isinstance(experiment[name], bool) or not isinstance(experiment[name], numbers.Real)]
+    if not_numbers:
+        raise ValueError(f"Expected numbers for {not_numbers}")
+    values = {name: float(experiment[name]) for name in INPUT_NAMES}
+    not_finite = [name for name in INPUT_NAMES if not np.isfinite(values[name])]
+    if not_finite:
+        raise ValueError(f"Expected finite numbers for {not_finite}")
+    fractional = [name for name in COUNT_NAMES if not values[name].is_integer()]
+    if fractional:
+        raise ValueError(f"Expected whole numbers for {fractional}")
+    if values["visitors_A"] <= 0 or values["visitors_B"] <= 0 or values["test_duration"] <= 0:
+        raise ValueError("Expected visitors of A and B and a positive test duration")
+    if not 0 <= values["conversions_A"] <= values["visitors_A"] or not 0 <= values["conversions_B"] <= values["visitors_B"]:
+        raise ValueError("Expected non negative conversions, no more than the visitors")
+    if not 0 < values["percent_traffic_in_test"] <= 100:
+        raise ValueError("Expected a percentage of traffic above 0 and up to 100")
+    return values
+
+
+def set_values(calc, values):
+    """
+    Sets the INPUT_NAMES of a validated experiment on calc as numpy floats, so a control without
+    conversions gives an infinite relative difference instead of raising
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        calc.setValues(*[np.float64(values[name]) for name in INPUT_NAMES])
+
+
+def json_values(values):
+    """Plain floats for the JSON response, with None for the values that are not finite"""
+    return [value if np.isfinite(value) else None for value in np.asarray(values, dtype=float).tolist()]
+
+
+def experiment_histograms(values):
+    """
+    Histograms of the posteriors of A and B and of their relative difference, as fractions per bin and
+    bin edges, and the 95% credible interval of the relative difference
+    """
+    calc = b.bayesCalculations()
+    set_values(calc, values)
+    calc.generate_posterior_samples()
+    calc.calculate_posterior_probabilities()
+    histograms = {name: {"edges": b.chart_values(edges), "values": b.chart_values(fractions)}
+                  for name, (fractions, edges) in calc.histograms().items()}
+    return histograms, json_values(calc.credible_interval())
+
+
+"""
+Headless JSON API with the statistics of the app for one or many experiments per request, for
+dashboards and automated checks that cannot drive a Shiny session. Every request is evaluated with
+the analytic engine in one vectorised pass over its experiments, in a pool of CONCURRENCY threads,
+and no figure is ever rendered
+"""
+def evaluate_experiments(experiments, histograms=False):
+    """
+    One result per experiment with the RESULT_NAMES, and the histograms and credible interval of the
+    relative difference when asked for, or an error for the experiments that are not valid
+    """
+    results = [None] * len(experiments)
+    valid = []
+    for i, experiment in enumerate(experiments):
+        try:
+            valid.append((i, validate(experiment)))
+        except ValueError as e:
+            results[i] = {"error": str(e)}
+    if not valid:
+        return results
+
+    with instr.stage("api_evaluate_experiments", experiments=len(valid)):
+        columns = {name: np.array([values[name] for i, values in valid]) for name in INPUT_NAMES}
+        counts = [columns[name] for name in COUNT_NAMES]
+        summary = b.posterior_summary(*counts, columns["test_duration"], columns["percent_traffic_in_test"], columns["aov"])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            summary["control_cr"] = counts[1] / counts[0]
+            summary["variant_cr"] = counts[3] / counts[2]
+            summary["relative_difference"] = summary["variant_cr"] / summary["control_cr"] - 1
+            min_uplift = columns["min_rev_yield"] / summary["revenue_in_six_months"]
+        # A control without conversions brings no revenue, so no uplift reaches a positive minimum yield,
+        # and any uplift reaches a minimum of -100% or less
+        integrate = np.isfinite(min_uplift) & (min_uplift > -1)
+        summary["prob_yield_mean"] = np.where(columns["min_rev_yield"] <= 0, 1.0, 0.0)
+        if np.any(integrate):
+            summary["prob_yield_mean"][integrate] = b.uplift_probability(
+                *[b.ALPHA_PRIOR + counts[1][integrate], b.BETA_PRIOR + (counts[0] - counts[1])[integrate],
+                  b.ALPHA_PRIOR + counts[3][integrate], b.BETA_PRIOR + (counts[2] - counts[3])[integrate]],
+                min_uplift[integrate],
+            )
+        rows = zip(*[json_values(summary[name]) for name in RESULT_NAMES])
+        for (i, values), row in zip(valid, rows):
+            results[i] = dict(zip(RESULT_NAMES, row))
+            if histograms:
+                results[i]["histograms"], results[i]["credible_interval"] = experiment_histograms(values)
+    return results
+
+
+class experimentsAPI(object):
+    def __init__(self, concurrency=CONCURRENCY, max_experiments=MAX_EXPERIMENTS, max_histogram_experiments=MAX_HISTOGRAM_EXPERIMENTS):
+        # The evaluations run in their own pool, so automated callers never hold up the sessions of the app
+        self.executor = ThreadPoolExecutor(concurrency)
+        self.max_experiments = max_experiments
+        self.max_histogram_experiments = max_histogram_experiments
+
+    async def experiments(self, request):
+        """
+        POST with one experiment, or with {"experiments": [...]} for many, and "histograms": true to also
+        get the histograms of each. Returns one result, or {"results": [...]} in the order of the experiments
+        """
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return JSONResponse({"error": "Expected a JSON body"}, status_code=400)
+        if not isinstance(body, dict):
+            return JSONResponse({"error": "Expected a JSON object"}, status_code=400)
+        batch = "experiments" in body
+        experiments = body["experiments"] if batch else [body]
+        if not isinstance(experiments, list):
+            return JSONResponse({"error": "Expected a list of experiments"}, status_code=400)
+        if len(experiments) > self.max_experiments:
+            return JSONResponse({"error": f"Expected at most {self.max_experiments} experiments per request"}, status_code=413)
+        histograms = body.get("histograms", False)
+        if not isinstance(histograms, bool):
+            return JSONResponse({"error": "Expected true or false for histograms"}, status_code=400)
+        # A pool thread is never held for more than a couple of seconds by the histograms of one request
+        if histograms and len(experiments) > self.max_histogram_experiments:
+            return JSONResponse({"error": f"Expected at most {self.max_histogram_experiments} experiments per request with histograms"},
+                                status_code=413)
+
+        results = await asyncio.get_running_loop().run_in_executor(
+            self.executor, evaluate_experiments, experiments, histograms
+        )
+        if batch:
+            return JSONResponse({"results": results})
+        return JSONResponse(results[0], status_code=400 if "error" in results[0] else 200)
+
+    def routes(self):
+        return [Route("/experiments", self.experiments, methods=["POST"])]
@@ -1,11 +1,257 @@
+import asyncio
+import base64
+import contextvars
+import functools
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from shiny import ui, render, reactive, App
+from shiny import ui, render, reactive, req, App
+from shiny.render.renderer import Renderer
+from shiny.session import get_current_session
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
 import shinyswatch
 import bayes_calculations as b
+import client_charts as cc
+import api
+import instrumentation as instr
+import result_cache as rc
 
 css_path = Path(__file__).parent / "www" / "calculator-theme.css"
-currency = "€"
-factor_projection = 1
+# Inputs of bayesCalculations.setValues, in order. Only the counts change the posteriors, the rest
+# are the inputs of bayesCalculations.setProjectionValues
+COUNT_NAMES, PROJECTION_NAMES, INPUT_NAMES = api.COUNT_NAMES, api.PROJECTION_NAMES, api.INPUT_NAMES
+# "server" renders the charts as PNGs with matplotlib, "client" sends their data and draws them in the browser
+CHART_RENDERING = os.environ.get("CHART_RENDERING", "server")
+# Calculations run in this pool, so a heavy request does not block the other sessions of the worker
+executor = ThreadPoolExecutor()
+# Results shared by all the sessions of the worker, and by all the workers through RESULT_CACHE_PATH if set
+RESULT_CACHE_MB = float(os.environ.get("RESULT_CACHE_MB", rc.MEMORY_BUDGET / 2**20))
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH")
+cache = rc.resultCache(RESULT_CACHE_MB * 2**20, RESULT_CACHE_PATH)
+# Path of the Prometheus metrics of the instrumented stages, not served if unset
+METRICS_PATH = os.environ.get("METRICS_PATH")
+# Path of the JSON API, not served if empty, and the requests to it evaluated at the same time
+API_PATH = os.environ.get("API_PATH", "/api")
+API_CONCURRENCY = int(os.environ.get("API_CONCURRENCY", api.CONCURRENCY))
+# Records of the last render of every output, by session, for the diagnostics panel
+render_timings = {}
+# Seconds after startup, when the port is already open, to load the calculation and plotting libraries
+# in the background. Empty to load them on the first request instead
+PREWARM_DELAY = os.environ.get("PREWARM_DELAY", "1")
+
+
+def prewarm():
+    """
+    Runs a small calculation, and when the charts are rendered on the server draws a figure to PNG, so
+    the first request does not pay for importing scipy and matplotlib, the font cache or the backend
+    setup. The figure is drawn on its own Agg canvas like the plots, so it is safe on a timer thread
+    """
+    calc = b.bayesCalculations()
+    calc.setValues(100, 10, 100, 12, 14, 100, 100, 1000)
+    calc.calculate_probabilities()
+    if CHART_RENDERING == "server":
+        b.plotting()
+        fig, ax = b.new_figure(figsize=(10, 4))
+        ax.bar([0, 1], [1, 2])
+        ax.set_title("A / B", **b.roboto)
+        fig.savefig(io.BytesIO(), format="png")
+
+
+if PREWARM_DELAY:
+    prewarm_timer = threading.Timer(float(PREWARM_DELAY), prewarm)
+    prewarm_timer.daemon = True
+    prewarm_timer.start()
+
+
+def calculate_posterior(calc):
+    """
+    Restores the posterior state of calc from the cache, or samples and stores it. Identical test data
+    is only ever calculated once, whichever session or worker asks for it
+    """
+    def compute():
+        calc.generate_posterior_samples()
+        if isinstance(calc, b.bayesMultiArmCalculations):
+            calc.calculate_probabilities()
+        else:
+            calc.calculate_posterior_probabilities()
+        return calc.posterior_state()
+
+    key = rc.cache_key(type(calc).__name__, calc.cache_inputs())
+    with instr.stage("result_cache_get") as details:
+        state = cache.get(key)
+        if details is not None:
+            details["hit"] = state is not None
+    if state is None:
+        state = compute()
+        cache.put(key, state)
+    calc.restore_posterior_state(state)
+
+
+def run_calculations(values):
+    """
+    Runs the posterior calculations of one click. New objects are created for every click, so sessions
+    never share state and a cancelled run cannot overwrite a newer one. The revenue projections are
+    calculated later, as they also depend on inputs that change without a new click. Also returns the
+    records of the instrumented stages, empty when instrumentation is off
+    """
+    with instr.collect() as records:
+        calc = b.bayesCalculations()
+        calc.setValues(*[values[name] for name in INPUT_NAMES])
+        # The cached state includes the binned histograms, so the plots only draw them
+        calculate_posterior(calc)
+
+        calc_multi = None
+        if len(values["labels"]) > 2:
+            calc_multi = b.bayesMultiArmCalculations()
+            calc_multi.setValues(values["visitors"], values["conversions"], values["labels"])
+            calculate_posterior(calc_multi)
+    return calc, calc_multi, records
+
+
+@functools.lru_cache(maxsize=32)
+def read_order_log(path):
+    """
+    Sufficient statistics of the orders of every variant of an uploaded order log. Every upload gets
+    its own path, so a log is only read once however many calculations use it
+    """
+    import order_logs as ol
+
+    return ol.order_statistics(path)
+
+
+def sample_revenue_posterior(path, visitors_A, visitors_B):
+    """
+    Reads the order log at path and samples the revenue per visitor posteriors of A and B in the
+    executor, as logs of hundreds of millions of orders take seconds to read. The posteriors only
+    depend on the visitors and the orders, so the duration and traffic of the projections are
+    applied later. Raises ValueError with the message for the user when the log cannot be used
+    """
+    import order_logs as ol
+
+    try:
+        statistics = read_order_log(path)
+    except (KeyError, ValueError, TypeError) as e:
+        raise ValueError(f"The order log could not be read, please upload a file with the columns {ol.ARM_COLUMN} and {ol.VALUE_COLUMN}. " + str(e))
+    try:
+        revenue_calc = b.bayesRevenueCalculations()
+        revenue_calc.setValues(visitors_A, statistics["A"], visitors_B, statistics["B"])
+    except (KeyError, ValueError, ZeroDivisionError):
+        raise ValueError(f"The order log needs at least {b.MIN_REVENUE_ORDERS} orders of A and of B, and no more orders than users.")
+    revenue_calc.generate_posterior_samples()
+    revenue_calc.calculate_posterior_probabilities()
+    return revenue_calc
+
+
+def simulate_futures(counts, test_duration, percent_traffic_in_test, seed):
+    """
+    Simulates the futures of the test of a click in the executor. They only depend on the counts, the
+    duration and the traffic, so the AOV and minimum yield are applied later without simulating again
+    """
+    planner = b.bayesPlanningCalculations(seed=seed)
+    planner.setValues(*counts, test_duration, percent_traffic_in_test)
+    planner.simulate_futures()
+    return planner
+
+
+class timedRender(object):
+    """
+    Renderer mixin that records the time to render the output, including the HTML building or the
+    rasterisation of the plot, for the diagnostics panel of the session
+    """
+    async def render(self):
+        if not instr.ENABLED:
+            return await super().render()
+        with instr.collect() as records:
+            with instr.stage(f"render {self.output_id}"):
+                value = await super().render()
+        render_timings.setdefault(get_current_session().id, {})[self.output_id] = records
+        return value
+
+
+def figure_png(draw, width, height, pixelratio):
+    """
+    Image data of the figure draw() builds as a PNG at the size of its output, laid out and encoded as
+    render.plot does
+    """
+    fig = draw()
+    dpi = fig.get_dpi()
+    fig.set_size_inches(width / dpi, height / dpi)
+    fig.set_layout_engine("tight")
+    with io.BytesIO() as buffer:
+        fig.savefig(buffer, format="png", dpi=dpi * pixelratio)
+        data = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    return {"src": "data:image/png;base64," + data, "width": "100%", "height": "100%"}
+
+
+class render_figure(Renderer[object]):
+    """
+    Renders a plot as render.plot does, but builds and rasterises the figure in the executor, so the
+    other sessions of the worker are not held up by matplotlib. The function returns the plot method,
+    with its arguments bound, instead of the figure. The plot methods draw on their own canvas
+    (see bayes_calculations.new_figure) and never through pyplot
+    """
+    def auto_output_ui(self):
+        return ui.output_plot(self.output_id)
+
+    async def transform(self, draw):
+        inputs = get_current_session().input
+        size = [inputs[f".clientdata_output_{self.output_id}_{dimension}"]() for dimension in ("width", "height")]
+        # The stages of the plot are recorded in the records collected by the render
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, contextvars.copy_context().run, figure_png, draw, *size, inputs[".clientdata_pixelratio"]()
+        )
+
+
+class timed_ui(timedRender, render.ui):
+    pass
+
+
+class timed_plot(timedRender, render_figure):
+    pass
+
+
+class timed_chart(timedRender, cc.render_chart):
+    pass
+
+
+class timed_data_frame(timedRender, render.data_frame):
+    pass
+
+
+def diagnostics_rows(records):
+    """Table rows of the records of instrumented stages"""
+    return "".join("""
+                <tr>
+                  <td>""" + record["stage"] + """</td>
+                  <td class="align-right">""" + f"{record['seconds'] * 1000:,.1f}" + """</td>
+                  <td class="align-right">""" + f"{record.get('samples', 0):,}" + """</td>
+                  <td class="align-right">""" + f"{record.get('bytes', 0):,}" + """</td>
+                  <td>""" + ", ".join(f"{key}: {value}" for key, value in record.items() if key not in ("stage", "seconds", "samples", "bytes")) + """</td>
+                </tr>"""
+        for record in records
+    )
+
+
+def chart_output(number):
+    """Output of chart number, rendered on the server or in the browser depending on CHART_RENDERING"""
+    if CHART_RENDERING == "client":
+        return cc.output_chart(f"chart_{number}")
+    return ui.output_plot(f"plot_{number}")
+
+
+def show_error(message):
+    """Shows message in a modal and stops the reactive calculation or effect that failed"""
+    m = ui.modal(
+    message,
+    title="",
+    easy_close=True,
+    footer=None)
+    ui.modal_show(m)
+    req(False)
 
 """
 Main Shiny app for the Bayesian A/B-test Calculator
@@ -24,6 +270,7 @@ app_ui = ui.page_fluid(
         gtag('config', 'G-EE3R9DZV33');
       </script>""")),
     ui.include_css(css_path),
+    ui.include_js(cc.js_path),
     ui.output_ui("head_html"),
     ui.layout_sidebar(
         ui.panel_sidebar(
@@ -37,6 +284,8 @@ app_ui = ui.page_fluid(
               ui.tags.div(ui.input_numeric("conversions_B", "Conversions B", value=1600), class_="form-group col-md-6 col-xs-12"),
               class_="row"
             ),
+            ui.output_ui("extra_arms"),
+            ui.input_numeric("num_arms", "Number of variants", value=2, min=2, max=len(b.ARM_LABELS)),
             ui.input_numeric("test_duration", "Test duration in days", value=14),
             ui.input_slider("percent_traffic_in_test", "Percentage of traffic", 1, 100, 100),
             ui.tags.div(
@@ -50,13 +299,25 @@ app_ui = ui.page_fluid(
               class_="row"
             ),
             
-            ui.input_action_button("compute", "Calculate", class_="btn-primary")
+            ui.input_slider("target_probability", "Target probability to plan for", 50, 99, 95, post="%"),
+            ui.input_file("daily_data", "Daily data (CSV)", accept=[".csv"]),
+            ui.input_file("segment_data", "Segment data (CSV)", accept=[".csv"]),
+            ui.input_file("order_data", "Order log (CSV or Parquet)", accept=[".csv", ".parquet"]),
+            ui.input_task_button("compute", "Calculate", label_busy="Calculating...", class_="btn-primary"),
+            ui.input_switch("diagnostics_switch", "Show diagnostics", False) if instr.ENABLED else None,
         ),
         ui.panel_main(
             ui.output_ui("main_result"),           
             ui.output_ui("risk_assesment"),
+            ui.output_ui("yield_curve"),
+            ui.output_ui("planner_result"),
+            ui.output_ui("revenue_result"),
+            ui.output_ui("multi_arm_result"),
+            ui.output_ui("sequential_result"),
+            ui.output_ui("segment_result"),
             ui.output_ui("posterior_simulation"),
             ui.output_ui("posterior_simulation_diff"),
+            ui.output_ui("diagnostics"),
         ),
     ),
 )
@@ -67,44 +328,230 @@ def server(input, output, session):
     It initializes a bayesCalculations object and defines several reactive event functions for different UI outputs and plots.
     """
 
-    calc = b.bayesCalculations()
-    
+    @ui.bind_task_button(button_id="compute")
+    @reactive.extended_task
+    async def calculation(values):
+        """
+        Runs the calculations in the executor and returns them with the inputs they were computed from,
+        so the outputs show a consistent snapshot of the click
+        """
+        calc, calc_multi, records = await asyncio.get_running_loop().run_in_executor(executor, run_calculations, values)
+        return calc, calc_multi, values, records
+
+    def test_data():
+        """
+        Snapshot of the inputs the posterior calculations depend on
+        """
+        labels = arm_labels()
+        values = {name: input[name]() for name in COUNT_NAMES}
+        values["labels"] = labels
+        values["visitors"] = [input[f"visitors_{label}"]() for label in labels]
+        values["conversions"] = [input[f"conversions_{label}"]() for label in labels]
+        return values
+
+    # Test data of the last calculation started
+    invoked = {}
+
     @reactive.Effect
     @reactive.event(input.compute)
     def _():
         """
         A "side effect" function that is called when the "Calculate" button is clicked. 
-        It calculates probabilities using Bayesian inference and handles ValueError exceptions.
+        It takes a snapshot of the inputs and starts the calculations in the background.
         """
-        global currency
-        global factor_projection
+        values = test_data()
+        invoked.update(values)
+        values.update({name: input[name]() for name in PROJECTION_NAMES})
+        calculation.invoke(values)
 
-        if input.currency_switch():
-            currency = "€"
-        else:
-            currency = "$"
+    @reactive.Effect
+    def _():
+        """
+        Cancels a running calculation when the test data changes, as its result would be outdated
+        """
+        values = test_data()
+        with reactive.isolate():
+            if calculation.status() == "running" and values != invoked:
+                calculation.cancel()
 
-        if input.year_assessment_switch():
-            factor_projection = 2
-        else:
-            factor_projection = 1
+    @reactive.Effect
+    def _():
+        """
+        Reports the calculations that failed because of invalid test data
+        """
+        if calculation.status() == "error":
+            show_error("An error occured, please check the test data input and try again.")
+
+    def results():
+        """
+        Results of the last calculation. While a new one is running the outputs keep showing the previous results
+        """
+        req(calculation.status() != "error")
+        return calculation.result()[:3]
+
+    session.on_ended(lambda: render_timings.pop(session.id, None))
+
+    @reactive.Calc
+    def projection():
+        """
+        Revenue projections of the last calculation for the current AOV, duration, traffic and minimum yield.
+        Changing them only repeats this step, never the sampling
+        """
+        calc, calc_multi, values = results()
+        projection_values = [input[name]() for name in PROJECTION_NAMES]
+        req(all(value is not None for value in projection_values))
+        try:
+            calc.setProjectionValues(*projection_values)
+            calc.calculate_revenue_projections()
+        except (ValueError, ZeroDivisionError):
+            show_error("An error occured, please check the test data input and try again.")
+        return calc
+
+    @reactive.extended_task
+    async def planning_simulation(counts, test_duration, percent_traffic_in_test, seed):
+        """Simulates the futures of the test over the next days in the executor"""
+        return await asyncio.get_running_loop().run_in_executor(executor, simulate_futures, counts, test_duration,
+                                                                percent_traffic_in_test, seed)
+
+    @reactive.Effect
+    def _():
+        """
+        Simulates the futures of the last calculation, and again when the duration or traffic change. The
+        seed of its samples is reused, so the same click always gives the same futures
+        """
+        calc, calc_multi, values = results()
+        test_duration, percent_traffic_in_test = input.test_duration(), input.percent_traffic_in_test()
+        req(test_duration is not None, percent_traffic_in_test is not None)
+        # Only the latest inputs are simulated, an outdated run or queued inputs are dropped
+        planning_simulation.cancel()
+        planning_simulation.invoke([values[name] for name in COUNT_NAMES], test_duration, percent_traffic_in_test,
+                                   calc.sampling_seed)
+
+    @reactive.Calc
+    def planning():
+        """
+        Futures of the test of the last calculation with the probabilities of reaching the current AOV and
+        minimum yield, which only repeat this step and never the simulation
+        """
+        req(planning_simulation.status() != "error")
+        planner = planning_simulation.result()
+        req(input.aov() is not None, input.min_rev_yield() is not None)
+        planner.setProjectionValues(input.aov(), input.min_rev_yield())
+        planner.calculate_yield_probabilities()
+        return planner
+
+    @reactive.Calc
+    def plan():
+        """Days and visitors the test needs to reach the target probability with PLANNING_ASSURANCE chance"""
+        planner = planning()
+        planner.calculate_plan(input.target_probability() / 100)
+        return planner
+
+    @reactive.extended_task
+    async def revenue_posterior(path, visitors_A, visitors_B):
+        """Reads an order log and samples its revenue per visitor posteriors in the executor"""
+        return await asyncio.get_running_loop().run_in_executor(executor, sample_revenue_posterior, path,
+                                                                visitors_A, visitors_B)
+
+    @reactive.Effect
+    def _():
+        """
+        Samples the revenue per visitor posteriors of A and B from the orders of the uploaded order log,
+        a CSV or Parquet file with the variant and revenue of each order, and the users of the last calculation
+        """
+        req(input.order_data())
+        calc, calc_multi, values = results()
+        # Only the latest order log and users are sampled, an outdated run or queued inputs are dropped
+        revenue_posterior.cancel()
+        revenue_posterior.invoke(input.order_data()[0]["datapath"], values["visitors_A"], values["visitors_B"])
+
+    @reactive.Calc
+    def revenue():
+        """Revenue projections of the order log for the current duration and traffic, without sampling again"""
+        try:
+            revenue_calc = revenue_posterior.result()
+        except ValueError as e:
+            show_error(str(e))
+        req(input.test_duration(), input.percent_traffic_in_test())
+        revenue_calc.setProjectionValues(input.test_duration(), input.percent_traffic_in_test())
+        revenue_calc.calculate_revenue_projections()
+        return revenue_calc
+
+    @reactive.Calc
+    def sequential():
+        """
+        Results after every day of the uploaded daily data, a CSV with the visitors and conversions of A
+        and B of each day and an optional date column
+        """
+        import pandas as pd
 
+        req(input.daily_data())
         try:
-          #b = bayesCalculations(visitors_A, conversions_A, visitors_B, conversions_B, test_duration, traffic_test, aov, min_rev_yield)
-          calc.setValues(input.visitors_A(), input.conversions_A(), input.visitors_B(), input.conversions_B(), input.test_duration(), input.percent_traffic_in_test(), input.aov(), input.min_rev_yield())
-          calc.generate_posterior_samples()
-          calc.calculate_probabilities()
-
-        except ValueError:
-            m = ui.modal(
-            "An error occured, please check the test data input and try again.",
-            title="",
-            easy_close=True,
-            footer=None)
-            ui.modal_show(m)
+            daily = pd.read_csv(input.daily_data()[0]["datapath"])
+            calc = b.bayesSequentialCalculations()
+            calc.setValues(*[daily[name].to_numpy() for name in COUNT_NAMES], input.percent_traffic_in_test(), input.aov(),
+                           labels=daily["date"].astype(str) if "date" in daily else None)
+            calc.calculate_probabilities()
+        except (KeyError, ValueError, TypeError, pd.errors.ParserError):
+            show_error("The daily data could not be read, please upload a CSV with the columns " + ", ".join(COUNT_NAMES) + " and optionally date.")
+        return calc
+
+    @reactive.Calc
+    def segments():
+        """
+        Results of every segment of the uploaded segment data, a CSV with the visitors and conversions of A
+        and B of each segment and one or more columns naming it, as device, country or channel
+        """
+        import pandas as pd
+
+        req(input.segment_data())
+        try:
+            data = pd.read_csv(input.segment_data()[0]["datapath"])
+            label_columns = [name for name in data.columns if name not in COUNT_NAMES]
+            labels = data[label_columns].astype(str).agg(" / ".join, axis=1) if label_columns else data.index + 1
+            calc = b.bayesSegmentCalculations()
+            calc.setValues(labels, *[data[name].to_numpy() for name in COUNT_NAMES], input.test_duration(),
+                           input.percent_traffic_in_test(), input.aov())
+            calc.calculate_probabilities()
+        except (KeyError, ValueError, TypeError, pd.errors.ParserError):
+            show_error("The segment data could not be read, please upload a CSV with the columns " + ", ".join(COUNT_NAMES) + " and the columns naming each segment.")
+        return calc
+
+    def currency():
+        """Currency symbol selected with the switch"""
+        return "€" if input.currency_switch() else "$"
+
+    def factor_projection():
+        """Factor from the six months projection to the selected period"""
+        return 2 if input.year_assessment_switch() else 1
+
+    def arm_labels():
+        """Labels of the variants in the test, capped to the supported number of variants"""
+        return list(b.ARM_LABELS[:max(2, min(input.num_arms() or 2, len(b.ARM_LABELS)))])
 
     @output
-    @render.ui
+    @timed_ui
+    def extra_arms():
+        """
+        Users and conversions inputs for every variant after A and B. The inputs are rebuilt when the number
+        of variants changes, so they start from the values already entered for the variants that stay
+        """
+        def value(name, default):
+            with reactive.isolate():
+                entered = input[name]() if name in input else None
+            return default if entered is None else entered
+
+        return ui.TagList(*[
+            ui.tags.div(
+              ui.tags.div(ui.input_numeric(f"visitors_{label}", f"Users {label}", value=value(f"visitors_{label}", 5000)), class_="form-group col-md-6 col-xs-12"),
+              ui.tags.div(ui.input_numeric(f"conversions_{label}", f"Conversions {label}", value=value(f"conversions_{label}", 1500)), class_="form-group col-md-6 col-xs-12"),
+              class_="row"
+            )
+            for label in arm_labels()[2:]
+        ])
+
+    @output
+    @timed_ui
     def head_html():
         """
         A function that generates the HTML for the header of the Bayesian A/B-test Calculator app.
@@ -123,17 +570,33 @@ def server(input, output, session):
         return ui.HTML(head_html_info)
 
     @output
-    @render.ui
-    @reactive.event(input.compute)
+    @timed_ui
     def main_result():
         """
         A function to generate the main test result UI, including probability charts and table data.
+        The table is a separate output, so the chart is not rendered again when only the table changes.
         """
+        results()
         main_result_info = """
         <div class="block">
             <h3>Main test result</h3>
             <h4>Probability of each variant being the best experience</h4>
-            <div id="outperforming-chart" class="ct-outperforming">""" + str(ui.output_plot("plot_1")) + """</div>
+            <div id="outperforming-chart" class="ct-outperforming">""" + str(chart_output(1)) + """</div>
+            """ + str(ui.output_ui("main_result_table")) + """
+        </div>"""
+        
+        return ui.HTML(main_result_info)
+
+    @output
+    @timed_ui
+    def main_result_table():
+        """
+        Table data of the main test result
+        """
+        calc, calc_multi, values = results()
+        calc = projection()
+        currency_symbol = currency()
+        main_result_table_info = """
             <table class="table">
               <thead>
                 <tr>
@@ -143,14 +606,14 @@ def server(input, output, session):
                   <th class="align-right">CR</th>
                   <th class="align-right">Uplift</th>
                   <th class="align-right move-tds">Chance of being best</th>
-                <th class="align-right move-tds">Chance of at least """ + currency + f"{input.min_rev_yield():,}" + """ extra revenue</th>
+                <th class="align-right move-tds">Chance of at least """ + currency_symbol + f"{input.min_rev_yield():,}" + """ extra revenue</th>
                 </tr>
               </thead>
               <tbody>
                 <tr>
                   <td>A</td>
-                  <td class="align-right">""" + f"{input.visitors_A():,}" + """</td>
-                  <td class="align-right">""" + f"{input.conversions_A():,}" + """</td>
+                  <td class="align-right">""" + f"{values['visitors_A']:,}" + """</td>
+                  <td class="align-right">""" + f"{values['conversions_A']:,}" + """</td>
                   <td class="align-right">""" + f"{calc.control_cr:.1%}" + """</td>
                   <td></td>
                   <td></td>
@@ -158,8 +621,8 @@ def server(input, output, session):
                 </tr>
                 <tr>
                   <td>B</td>
-                  <td class="align-right">""" + f"{input.visitors_B():,}" + """</td>
-                  <td class="align-right">""" + f"{input.conversions_B():,}" + """</td>
+                  <td class="align-right">""" + f"{values['visitors_B']:,}" + """</td>
+                  <td class="align-right">""" + f"{values['conversions_B']:,}" + """</td>
                   <td class="align-right">""" + f"{calc.variant_cr:.1%}" + """</td>
                   <td class="align-right">""" + f"{calc.relative_difference:.2%}" + """</td>
                   <td class="align-right move-tds">""" + f"{calc.prob_B:.1%}" + """</td>
@@ -167,19 +630,20 @@ def server(input, output, session):
                 </tr>
               </tbody>
             </table>
-            <p class="table-caption">Based on """ + f"{input.test_duration()}" + """ days of data, on average """ + f"{(input.visitors_A()+input.visitors_B())/2:,.0f}" + """ users per variation</p>
-        </div>"""
-        
-        return ui.HTML(main_result_info)
-        
+            <p class="table-caption">Based on """ + f"{input.test_duration()}" + """ days of data, on average """ + f"{(values['visitors_A']+values['visitors_B'])/2:,.0f}" + """ users per variation</p>
+"""
+        return ui.HTML(main_result_table_info)
+
     @output
-    @render.ui
-    @reactive.event(input.compute)
+    @timed_ui
     def risk_assesment():
         """
         This function generates a risk assessment report with probability and effect on revenue for implementing B. 
         It returns the risk assessment report as an HTML object.
         """
+        calc = projection()
+        currency_symbol = currency()
+        factor = factor_projection()
         risk_assesment_info = """<div class="block">
               <h3>Risk assessment of implementing B</h3>
             <div class="row">
@@ -196,12 +660,12 @@ def server(input, output, session):
                     <tr>
                       <td>Expected risk</td>
                       <td class="align-right">""" + f"{calc.prob_A:.1%}" + """</td>
-                      <td class="align-right">""" + currency + f"{abs(calc.expected_risk) * factor_projection:,.0f}" + """</td>
+                      <td class="align-right">""" + currency_symbol + f"{abs(calc.expected_risk) * factor:,.0f}" + """</td>
                     </tr>
                     <tr>
                       <td>Expected uplift</td>
                       <td class="align-right">""" + f"{calc.prob_B:.1%}" + """</td>
-                      <td class="align-right">""" + currency + f"{calc.expected_uplift * factor_projection:,.0f}" + """</td>
+                      <td class="align-right">""" + currency_symbol + f"{calc.expected_uplift * factor:,.0f}" + """</td>
                     </tr>
                   </tbody>
                 </table>
@@ -210,21 +674,292 @@ def server(input, output, session):
                 <div class="contribution """ + "%s" %("negative-contribution" if calc.total_contribution < 0  else "") + """">
                   <div class="contribution-label">Total contribution</div>
                   <div class="contribution-amount">
-                    """ + currency + f"{abs(calc.total_contribution) * factor_projection:,.0f}" + """
+                    """ + currency_symbol + f"{abs(calc.total_contribution) * factor:,.0f}" + """
                   </div>
                 </div>
               </div>
               </div>
               <div class="row">
               <div class="col-md-12">
-            <p class="table-caption">Based on an average order value of """ + currency + f"{input.aov():,}" + """ and """ + f"{6 * factor_projection}" + """ months time</p>
+            <p class="table-caption">Based on an average order value of """ + currency_symbol + f"{input.aov():,}" + """ and """ + f"{6 * factor}" + """ months time</p>
             </div>
               </div>
             </div>"""
         return ui.HTML(risk_assesment_info)
 
     @output
-    @render.ui
+    @timed_ui
+    def yield_curve():
+        """
+        Html section for the chance of reaching every minimum revenue yield, with the credible interval of the uplift
+        """
+        calc, calc_multi, values = results()
+        lower, upper = calc.credible_interval()
+        yield_curve_info = """
+        <div class="block">
+            <h3>Chance of extra revenue</h3>
+            <h4>Probability of B bringing at least each amount of extra revenue in six months (x axis).
+            The relative uplift of B is between """ + f"{lower:.2%}" + """ and """ + f"{upper:.2%}" + """ with 95% probability</h4>
+            <div id="test-results-chart" class="">""" + str(chart_output(5)) + """</div>
+        </div>"""
+        return ui.HTML(yield_curve_info)
+
+    @output
+    @timed_ui
+    def planner_result():
+        """
+        Html section for the days and users the test still needs to reach the target probability
+        """
+        planner = plan()
+        currency_symbol = currency()
+        target = f"{planner.target_probability:.0%}"
+        rows = "".join("""
+                <tr>
+                  <td>""" + goal + """</td>
+                  <td class="align-right">""" + ("-" if planner.days_needed[name] is None else f"{planner.days_needed[name]:,}") + """</td>
+                  <td class="align-right">""" + ("-" if planner.days_needed[name] is None else f"{planner.visitors_needed(name):,}") + """</td>
+                  <td class="align-right move-tds">""" + f"{planner.plan[name][-1]:.1%}" + """</td>
+                </tr>"""
+            for name, goal in [
+                ("prob_B", "B reaches a " + target + " chance of being best"),
+                ("decision", "A or B reaches a " + target + " chance of being best"),
+                ("prob_yield", "B reaches a " + target + " chance of " + currency_symbol + f"{input.min_rev_yield():,}" + " extra revenue"),
+            ]
+        )
+        planner_result_info = """
+        <div class="block">
+            <h3>Time to decision</h3>
+            <h4>Chance of B reaching a """ + target + """ chance of being best after each extra day of the test (x axis)</h4>
+            <div id="test-results-chart" class="">""" + str(chart_output(7)) + """</div>
+            <table class="table">
+              <thead>
+                <tr>
+                  <th>Goal</th>
+                  <th class="align-right">Extra days</th>
+                  <th class="align-right">Total users</th>
+                  <th class="align-right move-tds">Chance within """ + f"{planner.max_days}" + """ days</th>
+                </tr>
+              </thead>
+              <tbody>""" + rows + """
+              </tbody>
+            </table>
+            <p class="table-caption">Days until the goal is reached with """ + f"{planner.assurance:.0%}" + """ chance, over """ + f"{planner.num_simulations:,}" + """ futures
+            simulated from the current result at """ + f"{planner.visitors[0] / planner.test_duration:,.0f}" + """ users per day. Simulated with seed """ + str(planner.sampling_seed) + """</p>
+        </div>"""
+        return ui.HTML(planner_result_info)
+
+    @output
+    @timed_ui
+    def revenue_result():
+        """
+        Html section for the revenue per visitor of A and B from the uploaded order log, with its risk assessment
+        """
+        revenue_calc = revenue()
+        currency_symbol = currency()
+        factor = factor_projection()
+        lower, upper = revenue_calc.credible_interval()
+        rows = "".join("""
+                <tr>
+                  <td>""" + label + """</td>
+                  <td class="align-right">""" + f"{visitors:,}" + """</td>
+                  <td class="align-right">""" + f"{orders['orders']:,}" + """</td>
+                  <td class="align-right">""" + currency_symbol + f"{aov:,.2f}" + """</td>
+                  <td class="align-right">""" + currency_symbol + f"{rpv:,.2f}" + """</td>
+                  <td class="align-right">""" + uplift + """</td>
+                  <td class="align-right move-tds">""" + f"{prob:.1%}" + """</td>
+                </tr>"""
+            for label, visitors, orders, aov, rpv, uplift, prob in [
+                ("A", revenue_calc.visitors_A, revenue_calc.orders_A, revenue_calc.control_aov, revenue_calc.control_rpv, "", revenue_calc.prob_A),
+                ("B", revenue_calc.visitors_B, revenue_calc.orders_B, revenue_calc.variant_aov, revenue_calc.variant_rpv,
+                 f"{revenue_calc.relative_difference:.2%}", revenue_calc.prob_B),
+            ]
+        )
+        revenue_result_info = """
+        <div class="block">
+            <h3>Revenue per user</h3>
+            <h4>Probability of each variant bringing the most revenue per user, from the value of every order.
+            The relative uplift of B is between """ + f"{lower:.2%}" + """ and """ + f"{upper:.2%}" + """ with 95% probability</h4>
+            <table class="table">
+              <thead>
+                <tr>
+                  <th>#</th>
+                  <th class="align-right">Users</th>
+                  <th class="align-right">Orders</th>
+                  <th class="align-right">AOV</th>
+                  <th class="align-right">Revenue per user</th>
+                  <th class="align-right">Uplift</th>
+                  <th class="align-right move-tds">Chance of being best</th>
+                </tr>
+              </thead>
+              <tbody>""" + rows + """
+              </tbody>
+            </table>
+            <table class="table">
+              <thead>
+                <tr>
+                  <th>Implement B</th>
+                  <th class="align-right">Probability</th>
+                  <th class="align-right">Effect on revenue</th>
+                </tr>
+              </thead>
+              <tbody>
+                <tr>
+                  <td>Expected risk</td>
+                  <td class="align-right">""" + f"{revenue_calc.prob_A:.1%}" + """</td>
+                  <td class="align-right">""" + currency_symbol + f"{abs(revenue_calc.expected_risk) * factor:,.0f}" + """</td>
+                </tr>
+                <tr>
+                  <td>Expected uplift</td>
+                  <td class="align-right">""" + f"{revenue_calc.prob_B:.1%}" + """</td>
+                  <td class="align-right">""" + currency_symbol + f"{revenue_calc.expected_uplift * factor:,.0f}" + """</td>
+                </tr>
+                <tr>
+                  <td>Total contribution</td>
+                  <td></td>
+                  <td class="align-right">""" + ("-" if revenue_calc.total_contribution < 0 else "") + currency_symbol + f"{abs(revenue_calc.total_contribution) * factor:,.0f}" + """</td>
+                </tr>
+              </tbody>
+            </table>
+            <p class="table-caption">Users of the main test result and orders of the order log, projected to """ + f"{6 * factor}" + """ months.
+            Sampled with seed """ + str(revenue_calc.sampling_seed) + """</p>
+        </div>"""
+        return ui.HTML(revenue_result_info)
+
+    @output
+    @timed_ui
+    def multi_arm_result():
+        """
+        Result of a test with more than two variants: the probability of each variant being the best
+        and its expected loss in conversion rate against the best variant
+        """
+        calc, calc_multi, values = results()
+        if calc_multi is None:
+            return None
+        rows = "".join("""
+                <tr>
+                  <td>""" + label + """</td>
+                  <td class="align-right">""" + f"{visitors:,}" + """</td>
+                  <td class="align-right">""" + f"{conversions:,}" + """</td>
+                  <td class="align-right">""" + f"{cr:.1%}" + """</td>
+                  <td class="align-right">""" + f"{prob:.1%}" + """</td>
+                  <td class="align-right">""" + f"{loss:.2%}" + """</td>
+                </tr>"""
+            for label, visitors, conversions, cr, prob, loss in zip(
+                calc_multi.labels, calc_multi.visitors, calc_multi.conversions, calc_multi.conversion_rates,
+                calc_multi.prob_best, calc_multi.relative_expected_loss
+            )
+        )
+        multi_arm_result_info = """
+        <div class="block">
+            <h3>All variants</h3>
+            <h4>Probability of each variant being the best experience</h4>
+            <div id="test-results-chart" class="">""" + str(chart_output(4)) + """</div>
+            <table class="table">
+              <thead>
+                <tr>
+                  <th>#</th>
+                  <th class="align-right">Users</th>
+                  <th class="align-right">Conversion</th>
+                  <th class="align-right">CR</th>
+                  <th class="align-right move-tds">Chance of being best</th>
+                  <th class="align-right move-tds">Expected loss</th>
+                </tr>
+              </thead>
+              <tbody>""" + rows + """
+              </tbody>
+            </table>
+            <p class="table-caption">Expected loss is the expected relative drop in conversion rate from implementing the variant instead of the best one.
+            Sampled with seed """ + str(calc_multi.sampling_seed) + """</p>
+        </div>"""
+        return ui.HTML(multi_arm_result_info)
+
+    @output
+    @timed_ui
+    def sequential_result():
+        """
+        Probability of B being the best experience after every day of the uploaded daily data, with the
+        results of the last days
+        """
+        calc = sequential()
+        currency_symbol = currency()
+        factor = factor_projection()
+        timeline = calc.timeline()
+        rows = "".join("""
+                <tr>
+                  <td>""" + str(timeline["period"][i]) + """</td>
+                  <td class="align-right">""" + f"{timeline['visitors_A'][i] + timeline['visitors_B'][i]:,}" + """</td>
+                  <td class="align-right">""" + f"{timeline['prob_B'][i]:.1%}" + """</td>
+                  <td class="align-right">""" + currency_symbol + f"{abs(timeline['expected_risk'][i]) * factor:,.0f}" + """</td>
+                  <td class="align-right">""" + currency_symbol + f"{timeline['expected_uplift'][i] * factor:,.0f}" + """</td>
+                  <td class="align-right">""" + ("-" if timeline["total_contribution"][i] < 0 else "") + currency_symbol + f"{abs(timeline['total_contribution'][i]) * factor:,.0f}" + """</td>
+                </tr>"""
+            for i in range(len(timeline["period"]) - 1, max(-1, len(timeline["period"]) - 8), -1)
+        )
+        sequential_result_info = """
+        <div class="block">
+            <h3>Probability over time</h3>
+            <h4>Probability of B being the best experience after every day of the test (x axis)</h4>
+            <div id="test-results-chart" class="">""" + str(chart_output(6)) + """</div>
+            <table class="table">
+              <thead>
+                <tr>
+                  <th>Day</th>
+                  <th class="align-right">Users</th>
+                  <th class="align-right move-tds">Chance of B being best</th>
+                  <th class="align-right">Expected risk</th>
+                  <th class="align-right">Expected uplift</th>
+                  <th class="align-right">Total contribution</th>
+                </tr>
+              </thead>
+              <tbody>""" + rows + """
+              </tbody>
+            </table>
+            <p class="table-caption">Cumulative results of the last days, projected to """ + f"{6 * factor}" + """ months</p>
+        </div>"""
+        return ui.HTML(sequential_result_info)
+
+    @output
+    @timed_ui
+    def segment_result():
+        """
+        Html section for the result of every segment of the uploaded segment data
+        """
+        calc = segments()
+        segment_result_info = """
+        <div class="block">
+            <h3>Segments</h3>
+            <h4>Result of the test in every segment. Click a column to sort the segments by it</h4>
+            """ + str(ui.output_data_frame("segment_table")) + """
+            <p class="table-caption">""" + f"{len(calc.segments):,}" + """ segments, with revenue projected to """ + f"{6 * factor_projection()}" + """ months</p>
+        </div>"""
+        return ui.HTML(segment_result_info)
+
+    @output
+    @timed_data_frame
+    def segment_table():
+        """Sortable table of the segments, with the revenue in the selected currency and period"""
+        import pandas as pd
+
+        table = segments().table()
+        currency_symbol = currency()
+        factor = factor_projection()
+        return render.DataGrid(pd.DataFrame({
+            "Segment": table["segment"],
+            "Users A": table["visitors_A"],
+            "Conversions A": table["conversions_A"],
+            "Users B": table["visitors_B"],
+            "Conversions B": table["conversions_B"],
+            "CR A (%)": (table["control_cr"] * 100).round(2),
+            "CR B (%)": (table["variant_cr"] * 100).round(2),
+            "Uplift (%)": (table["relative_difference"] * 100).round(2),
+            "Chance of B being best (%)": (table["prob_B"] * 100).round(1),
+            f"Expected risk ({currency_symbol})": (abs(table["expected_risk"]) * factor).round(),
+            f"Expected uplift ({currency_symbol})": (table["expected_uplift"] * factor).round(),
+            f"Total contribution ({currency_symbol})": (table["total_contribution"] * factor).round(),
+        }), width="100%", summary=False)
+
+    @output
+    @timed_ui
     @reactive.event(input.compute)
     def posterior_simulation():
         """
@@ -233,14 +968,14 @@ def server(input, output, session):
         posterior_simulation_info = """
         <div class="block">
             <h3>Posterior simulation of A and B distributions</h3>
-            <h4>Monte Carlo simulation of Beta(1,1) of a Bernoulli distribution with 500,000 random trials. 
-            Shows the conversion rates of both A and B simulations (x axis) and its frequency percentage out of total samples (y axis)</h4>
-            <div id="test-results-chart" class="">""" + str(ui.output_plot("plot_2")) + """</div>
+            <h4>Posterior Beta distributions of the conversion rates of A and B, starting from a Beta(1,1) prior. 
+            Shows the conversion rates of both A and B (x axis) and their probability (y axis)</h4>
+            <div id="test-results-chart" class="">""" + str(chart_output(2)) + """</div>
         </div>"""
         return ui.HTML(posterior_simulation_info)
     
     @output
-    @render.ui
+    @timed_ui
     @reactive.event(input.compute)
     def posterior_simulation_diff():
         """
@@ -250,30 +985,136 @@ def server(input, output, session):
         <div class="block">
             <h3>Posterior simulation of difference</h3>
             <h4>Difference in conversion rate between B and A. Shows the relative conversion rate increase
-            (x axis) and its frequency percentage out of total samples (y axis)</h4>
-            <div id="test-results-chart" class="">""" + str(ui.output_plot("plot_3")) + """</div>
+            (x axis) and its probability (y axis)</h4>
+            <div id="test-results-chart" class="">""" + str(chart_output(3)) + """</div>
         </div>"""
         return ui.HTML(posterior_simulation_diff_info)   
         
     @output
-    @render.plot
-    @reactive.event(input.compute)
+    @timed_plot
     def plot_1():
-        return calc.plot_bayesian_probabilities()
+        calc, calc_multi, values = results()
+        return calc.plot_bayesian_probabilities
         
     @output
-    @render.plot
-    @reactive.event(input.compute)
+    @timed_plot
     def plot_2():
-        return calc.plot_simulation()
+        calc, calc_multi, values = results()
+        return calc.plot_simulation
     
     @output
-    @render.plot
-    @reactive.event(input.compute)
+    @timed_plot
     def plot_3():
-        return calc.plot_simulation_of_difference()
+        calc, calc_multi, values = results()
+        return calc.plot_simulation_of_difference
+
+    @output
+    @timed_plot
+    def plot_5():
+        return functools.partial(projection().plot_yield_curve, currency())
+
+    @output
+    @timed_plot
+    def plot_4():
+        calc, calc_multi, values = results()
+        req(calc_multi)
+        return calc_multi.plot_bayesian_probabilities
+
+    @output
+    @timed_plot
+    def plot_6():
+        return sequential().plot_probability_over_time
+
+    @output
+    @timed_plot
+    def plot_7():
+        return plan().plot_assurance
+
+
+    @output
+    @timed_chart
+    def chart_1():
+        calc, calc_multi, values = results()
+        return calc.probabilities_chart_data()
+
+    @output
+    @timed_chart
+    def chart_2():
+        calc, calc_multi, values = results()
+        return calc.simulation_chart_data()
 
+    @output
+    @timed_chart
+    def chart_3():
+        calc, calc_multi, values = results()
+        return calc.difference_chart_data()
+
+    @output
+    @timed_chart
+    def chart_4():
+        calc, calc_multi, values = results()
+        req(calc_multi)
+        return calc_multi.probabilities_chart_data()
+
+    @output
+    @timed_chart
+    def chart_5():
+        return projection().yield_curve_chart_data(currency())
+
+    @output
+    @timed_chart
+    def chart_6():
+        return sequential().probability_chart_data()
+
+    @output
+    @timed_chart
+    def chart_7():
+        return plan().assurance_chart_data()
+
+    @output
+    @render.ui
+    def diagnostics():
+        """
+        Opt-in panel with the time, samples and bytes of every stage of the last calculation and of the
+        last render of every output. Only available when instrumentation is on
+        """
+        if not instr.ENABLED or not input.diagnostics_switch():
+            return None
+        reactive.invalidate_later(2)
+        records = calculation.result()[3] if calculation.status() == "success" else []
+        renders = [record for output_records in render_timings.get(session.id, {}).values() for record in output_records]
+        diagnostics_info = """
+        <div class="block">
+            <h3>Diagnostics</h3>
+            <table class="table">
+              <thead>
+                <tr>
+                  <th>Stage</th>
+                  <th class="align-right">Time (ms)</th>
+                  <th class="align-right">Samples</th>
+                  <th class="align-right">Bytes</th>
+                  <th>Details</th>
+                </tr>
+              </thead>
+              <tbody>""" + diagnostics_rows(records) + diagnostics_rows(renders) + """
+              </tbody>
+            </table>
+            <p class="table-caption">Stages of the last calculation, then of the last render of every output</p>
+        </div>"""
+        return ui.HTML(diagnostics_info)
 
 app = App(app_ui, server, debug=False)
 
 
+def metrics_endpoint(request):
+    """Prometheus metrics of the instrumented stages of this worker"""
+    return PlainTextResponse(instr.metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+routes = []
+if METRICS_PATH:
+    routes.append(Route(METRICS_PATH, metrics_endpoint))
+if API_PATH:
+    routes.append(Mount(API_PATH, routes=api.experimentsAPI(API_CONCURRENCY).routes()))
+if routes:
+    app = Starlette(routes=routes + [Mount("/", app=app)])
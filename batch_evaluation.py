@@ -0,0 +1,140 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import bayes_calculations as b
+import api
+
+# Columns of an experiment, the inputs and results of an experiment of the API
+INPUT_COLUMNS = api.INPUT_NAMES
+RESULT_COLUMNS = api.RESULT_NAMES
+CHUNK_SIZE = 1000
+
+
+def sample_experiment(calc, experiment):
+    """
+    Result of one experiment with an engine that samples, as a dict with the RESULT_COLUMNS, or with
+    the error of an experiment that is not valid
+    """
+    try:
+        values = api.validate(experiment)
+    except ValueError as e:
+        return {"error": str(e)}
+    api.set_values(calc, values)
+    # The revenue of a control without conversions is zero, so its minimum uplift is infinite
+    with np.errstate(divide="ignore", invalid="ignore"):
+        calc.generate_posterior_samples()
+        calc.calculate_probabilities()
+    return {column: getattr(calc, column) for column in RESULT_COLUMNS}
+
+
+"""
+Headless evaluation of many experiments read from a CSV or Parquet file, one row per test.
+Chunks of rows are evaluated across a process pool and the results are streamed to the output
+file in the input order, without rendering any plot
+"""
+def evaluate_experiments(experiments, engine="analytic", seed=None):
+    """
+    Evaluates every row of a DataFrame with the INPUT_COLUMNS. Returns the rows with the
+    RESULT_COLUMNS appended and an error column for the rows that are not valid, checked as the
+    JSON API checks them. With a seed, the engines that sample give the same results on every run
+    """
+    missing = [column for column in INPUT_COLUMNS if column not in experiments.columns]
+    if missing:
+        raise ValueError(f"Missing columns {missing}")
+
+    rows = experiments[INPUT_COLUMNS].to_dict("records")
+    if engine == "analytic":
+        # All the rows of the chunk are integrated together in one vectorised pass, as in the JSON API
+        evaluations = api.evaluate_experiments(rows)
+    else:
+        # The chunks already run in parallel processes, so each one samples in a single thread
+        calc = b.bayesCalculations(engine, seed=seed, workers=1)
+        evaluations = [sample_experiment(calc, row) for row in rows]
+
+    evaluated = experiments.reset_index(drop=True).copy()
+    evaluated[RESULT_COLUMNS] = np.array([[evaluation.get(column) for column in RESULT_COLUMNS] for evaluation in evaluations], dtype=float).reshape(-1, len(RESULT_COLUMNS))
+    evaluated["error"] = [evaluation.get("error", "") for evaluation in evaluations]
+    return evaluated
+
+
+def read_experiments(path, chunk_size=CHUNK_SIZE):
+    """Reads the experiments file in chunks of rows, so the whole file is never held in memory"""
+    if Path(path).suffix == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class resultsWriter(object):
+    """Appends evaluated chunks to a CSV or Parquet file"""
+    def __init__(self, path):
+        self.path = path
+        self.parquet = Path(path).suffix == ".parquet"
+        self.writer = None
+
+    def write(self, chunk):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table.cast(self.writer.schema))
+        else:
+            chunk.to_csv(self.path, mode="a" if self.writer else "w", header=not self.writer, index=False)
+            self.writer = True
+
+    def close(self):
+        if self.parquet and self.writer is not None:
+            self.writer.close()
+
+
+def evaluate_file(input_path, output_path, engine="analytic", workers=None, chunk_size=CHUNK_SIZE, seed=None):
+    """
+    Evaluates all the experiments of input_path across a pool of worker processes and streams the
+    results to output_path. At most two chunks per worker are in flight at any time. Returns the
+    number of experiments evaluated
+    """
+    workers = workers or os.cpu_count()
+    writer = resultsWriter(output_path)
+    evaluated = 0
+    try:
+        with ProcessPoolExecutor(workers) as executor:
+            pending = []
+            for chunk in read_experiments(input_path, chunk_size):
+                pending.append(executor.submit(evaluate_experiments, chunk, engine, seed))
+                if len(pending) >= 2 * workers:
+                    result = pending.pop(0).result()
+                    writer.write(result)
+                    evaluated += len(result)
+            for future in pending:
+                result = future.result()
+                writer.write(result)
+                evaluated += len(result)
+    finally:
+        writer.close()
+    return evaluated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a file of A/B tests, one row per test")
+    parser.add_argument("input", help="CSV or Parquet file with the columns " + ", ".join(INPUT_COLUMNS))
+    parser.add_argument("output", help="CSV or Parquet file for the results")
+    parser.add_argument("--engine", default="analytic", choices=b.ENGINES)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of cores")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="experiments per task")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the engines that sample, for reproducible results")
+    args = parser.parse_args(argv)
+
+    evaluated = evaluate_file(args.input, args.output, args.engine, args.workers, args.chunk_size, args.seed)
+    print(f"Evaluated {evaluated:,} experiments into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
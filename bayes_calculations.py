@@ -1,11 +1,288 @@
-import matplotlib.pyplot as plt
-import scipy.stats as scs
-import matplotlib.ticker as mtick
-import seaborn as sns
-from matplotlib.ticker import AutoMinorLocator
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import instrumentation as instr
 
 roboto = {"fontname": "system-ui", "size": "12"}
 NUM_POSTERIOR_SAMPLES = 500000
+# Labels of the variants of a multi-variant test, which also caps the number of variants
+ARM_LABELS = "ABCDEFGH"
+# Beta prior of the conversion rates
+ALPHA_PRIOR = 1
+BETA_PRIOR = 1
+# Normal-inverse-gamma prior of the log order values of the revenue engine: mean, weight in orders and
+# shape and scale of the variance, and the sufficient statistics of the orders of a variant it takes
+LOG_VALUE_PRIOR = (0.0, 0.01, 1.0, 1.0)
+ORDER_STATISTICS = ["orders", "revenue", "log_revenue", "log_revenue_squares"]
+# Orders of a variant the revenue engine needs, below them the tail of the variance of the log order
+# values dominates the mean order value
+MIN_REVENUE_ORDERS = 30
+
+# Engines available to compute the probabilities: "analytic" integrates over the Beta densities,
+# "montecarlo" averages over the posterior samples, "streaming" draws them in chunks of
+# STREAMING_CHUNK_SIZE, accumulating every statistic so that memory does not grow with the sample count,
+# and "adaptive" streams batches of ADAPTIVE_BATCH_SIZE until the standard errors reach the tolerance
+ENGINES = ("analytic", "montecarlo", "streaming", "adaptive")
+STREAMED_ENGINES = ("streaming", "adaptive")
+STREAMING_CHUNK_SIZE = 50000
+ADAPTIVE_BATCH_SIZE = 2000
+ADAPTIVE_TOLERANCE = 0.001
+# Samples drawn from each random stream. The draws are split in blocks of this size, each from its own
+# stream spawned from the seed, so the samples only depend on the seed and not on the number of workers
+SAMPLING_BLOCK_SIZE = 50000
+# Bins of the posterior histograms, tail mass left out of their range and bin width of the difference histogram
+HISTOGRAM_BINS = 50
+HISTOGRAM_TAIL = 1e-6
+DIFFERENCE_BINWIDTH = 0.005
+# Cap on the bins of the difference histogram and tail mass left out of its range
+MAX_DIFFERENCE_BINS = 200
+DIFFERENCE_PLOT_TAIL = 1e-4
+# Cap on the bins the streaming engines count the difference in, reached when the control has almost no
+# conversions and the ratio of B to A spans orders of magnitude
+MAX_STREAMED_DIFFERENCE_BINS = 20000
+# Points of the grid the analytic survival function of the difference is tabulated on and of the minimum yield curve
+QUANTILE_GRID_POINTS = 128
+YIELD_CURVE_POINTS = 200
+# Gauss-Legendre nodes per integration panel and tail mass left out of the integration window
+QUADRATURE_NODES = 64
+QUADRATURE_TAIL = 1e-12
+QUADRATURE_POINTS, QUADRATURE_WEIGHTS = np.polynomial.legendre.leggauss(QUADRATURE_NODES)
+# Tests integrated together by posterior_summary, which bounds its memory to a few MB for any number of tests
+QUADRATURE_BATCH_SIZE = 1000
+# Futures simulated by the planner, longest extension of a test in days it considers and chance of
+# reaching a target it plans for
+PLANNING_SIMULATIONS = 4000
+PLANNING_MAX_DAYS = 180
+PLANNING_ASSURANCE = 0.8
+# Days the revenue projections cover
+SIX_MONTHS_IN_DAYS = 182.5
+
+
+def plotting():
+    """
+    Imports the plotting libraries when the first plot is drawn, so workers that only calculate, or
+    send the chart data to the browser, never load them. The plots are drawn on Agg canvases of their
+    own (see new_figure), but seaborn imports pyplot, so the non-interactive Agg backend is selected
+    unless pyplot was already set up
+    """
+    if "matplotlib.pyplot" not in sys.modules:
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.ticker as mtick
+    import seaborn as sns
+    return mtick, sns
+
+
+def new_figure(figsize):
+    """
+    Figure and axes on their own Agg canvas instead of pyplot, whose global state is not thread safe,
+    so the plots can be built and rasterised in the executor while other sessions draw theirs
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize, dpi=75)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
+
+
+def draw_samples(draw_block, arms, size, seed, workers=None):
+    """
+    Fills an (arms x size) matrix with the samples draw_block(rng, n) returns for n samples of every
+    arm. Each block of SAMPLING_BLOCK_SIZE samples comes from a numpy Generator spawned from seed, an
+    int or a SeedSequence, and the blocks are drawn in parallel by up to workers threads, as numpy
+    releases the GIL while it fills them. The same seed gives bit-identical samples with any number
+    of workers
+    """
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    starts = range(0, size, SAMPLING_BLOCK_SIZE)
+    streams = seed.spawn(len(starts))
+    samples = np.empty((arms, size))
+
+    def draw(block):
+        start = starts[block]
+        stop = min(start + SAMPLING_BLOCK_SIZE, size)
+        samples[:, start:stop] = draw_block(np.random.default_rng(streams[block]), stop - start)
+
+    workers = min(workers or os.cpu_count() or 1, len(starts))
+    if workers <= 1:
+        for block in range(len(starts)):
+            draw(block)
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(draw, range(len(starts))))
+    return samples
+
+
+def draw_beta_samples(alphas, betas, size, seed, workers=None):
+    """Draws size samples of every Beta(alpha, beta) into an (arms x size) matrix with draw_samples"""
+    alphas = np.asarray(alphas, dtype=float)[:, None]
+    betas = np.asarray(betas, dtype=float)[:, None]
+    return draw_samples(lambda rng, n: rng.beta(alphas, betas, (len(alphas), n)), len(alphas), size, seed, workers)
+
+
+def quadrature_points(posterior_A, window):
+    """
+    Gauss-Legendre points and weights times the density of A for rows of posteriors of A, over the
+    bulk of A split at the two ends of window, the range where the integrand switches from its lower
+    to its upper tail, clipped to the bulk
+    """
+    lower_A, upper_A = posterior_A.ppf(QUADRATURE_TAIL), posterior_A.ppf(1 - QUADRATURE_TAIL)
+    edges = np.sort(np.hstack([lower_A, np.clip(window, lower_A, upper_A), upper_A]), axis=1)
+    half_widths = np.diff(edges, axis=1)[:, :, None] / 2
+    shape = (len(edges), (edges.shape[1] - 1) * QUADRATURE_NODES)
+    points = (edges[:, :-1, None] + half_widths + half_widths * QUADRATURE_POINTS).reshape(shape)
+    return points, (half_widths * QUADRATURE_WEIGHTS).reshape(shape) * posterior_A.pdf(points)
+
+
+def posterior_statistics(alpha_A, beta_A, alpha_B, beta_B):
+    """
+    P(B >= A) and E[B / A - 1; B > A] and E[B / A - 1; B < A] for arrays of Beta posteriors of A and B,
+    in one vectorised pass. Each row is integrated over the density of A with Gauss-Legendre
+    quadrature, split where B switches from its lower to its upper tail, with the distribution of
+    B evaluated in closed form
+    """
+    import scipy.stats as scs
+
+    alpha_A, beta_A, alpha_B, beta_B = (np.asarray(value, dtype=float).reshape(-1, 1) for value in (alpha_A, beta_A, alpha_B, beta_B))
+    posterior_A = scs.beta(alpha_A, beta_A)
+    posterior_B = scs.beta(alpha_B, beta_B)
+    mean_B = alpha_B / (alpha_B + beta_B)
+    # B weighted by its own density, used for E[B; B > a] = E[B] * P(B' > a) with B' ~ Beta(alpha + 1, beta)
+    weighted_B = scs.beta(alpha_B + 1, beta_B)
+    points, density = quadrature_points(posterior_A, np.hstack([posterior_B.ppf(QUADRATURE_TAIL), posterior_B.ppf(1 - QUADRATURE_TAIL)]))
+
+    sf_B = posterior_B.sf(points)
+    prob_B = np.sum(density * sf_B, axis=1)
+    positive_difference = np.sum(density * (mean_B * weighted_B.sf(points) / points - sf_B), axis=1)
+    negative_difference = np.sum(density * (mean_B * weighted_B.cdf(points) / points - posterior_B.cdf(points)), axis=1)
+    return prob_B, positive_difference, negative_difference
+
+
+def uplift_probability(alpha_A, beta_A, alpha_B, beta_B, min_uplift):
+    """
+    P(B / A - 1 >= min_uplift) for arrays of Beta posteriors of A and B and of thresholds, broadcast
+    against each other, in one vectorised pass. The analytic engine of bayesCalculations answers its
+    thresholds with it
+    """
+    import scipy.stats as scs
+
+    alpha_A, beta_A, alpha_B, beta_B, scale = (np.asarray(value, dtype=float).reshape(-1, 1) for value in np.broadcast_arrays(
+        alpha_A, beta_A, alpha_B, beta_B, 1 + np.asarray(min_uplift, dtype=float)))
+    posterior_B = scs.beta(alpha_B, beta_B)
+    points, density = quadrature_points(scs.beta(alpha_A, beta_A), np.hstack([posterior_B.ppf(QUADRATURE_TAIL), posterior_B.ppf(1 - QUADRATURE_TAIL)]) / scale)
+    return np.sum(density * posterior_B.sf(scale * points), axis=1)
+
+
+def visitors_in_six_months(visitors, test_duration, percent_traffic_in_test):
+    """All the visitors of six months at the rate of the visitors the test got in test_duration days with its share of the traffic"""
+    return visitors / (percent_traffic_in_test / 100) / test_duration * SIX_MONTHS_IN_DAYS
+
+
+def posterior_summary(visitors_A, conversions_A, visitors_B, conversions_B, test_duration, percent_traffic_in_test, aov):
+    """
+    Probabilities, mean positive and negative relative changes and six months revenue projections of
+    arrays of tests, one per element, as bayesCalculations computes them for one test with the
+    analytic engine. The tests are integrated in batches of QUADRATURE_BATCH_SIZE
+    """
+    visitors_A, conversions_A, visitors_B, conversions_B, test_duration = np.broadcast_arrays(
+        *(np.asarray(values, dtype=float) for values in (visitors_A, conversions_A, visitors_B, conversions_B, test_duration))
+    )
+    prob_B, positive_difference, negative_difference = (np.concatenate(values) for values in zip(*[
+        posterior_statistics(ALPHA_PRIOR + conversions_A[batch], BETA_PRIOR + visitors_A[batch] - conversions_A[batch],
+                             ALPHA_PRIOR + conversions_B[batch], BETA_PRIOR + visitors_B[batch] - conversions_B[batch])
+        for batch in (slice(start, start + QUADRATURE_BATCH_SIZE) for start in range(0, max(len(visitors_A), 1), QUADRATURE_BATCH_SIZE))
+    ]))
+    prob_A = 1 - prob_B
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_positive_difference = np.where(prob_B > 0, positive_difference / prob_B, 0)
+        mean_negative_difference = np.where(prob_A > 0, negative_difference / prob_A, 0)
+        control_cr = np.where(visitors_A > 0, conversions_A / visitors_A, 0)
+
+    # Revenue of the control in six months at the traffic of the test, as in bayesCalculations.revenue_in_six_months
+    revenue_in_six_months = visitors_in_six_months(visitors_A + visitors_B, test_duration, percent_traffic_in_test) * control_cr * aov
+    expected_risk = revenue_in_six_months * mean_negative_difference
+    expected_uplift = revenue_in_six_months * mean_positive_difference
+    return {
+        "revenue_in_six_months": revenue_in_six_months,
+        "prob_A": prob_A,
+        "prob_B": prob_B,
+        "mean_positive_difference": mean_positive_difference,
+        "mean_negative_difference": mean_negative_difference,
+        "expected_risk": expected_risk,
+        "expected_uplift": expected_uplift,
+        "total_contribution": expected_risk * prob_A + expected_uplift * prob_B,
+    }
+
+
+def trigamma(x):
+    """
+    Trigamma function of an array, shifted with psi1(x) = psi1(x + 1) + 1 / x^2 until its asymptotic
+    series is exact to double precision, as scipy's polygamma is slow on large arrays
+    """
+    x = np.asarray(x, dtype=float)
+    result = np.zeros_like(x)
+    while np.any(x < 6):
+        small = x < 6
+        result += np.where(small, 1 / x**2, 0)
+        x = np.where(small, x + 1, x)
+    inverse = 1 / x
+    inverse_squared = inverse * inverse
+    return result + inverse + inverse_squared / 2 + inverse * inverse_squared * (1 / 6 - inverse_squared * (1 / 30 - inverse_squared * (1 / 42 - inverse_squared / 30)))
+
+
+def log_uplift_moments(alpha_A, beta_A, alpha_B, beta_B):
+    """
+    Exact mean and standard deviation of log(B) - log(A) for arrays of Beta posteriors of A and B, the
+    normal approximation approximate_uplift_probability evaluates thresholds with
+    """
+    import scipy.special as scsp
+
+    mean = scsp.digamma(alpha_B) - scsp.digamma(alpha_B + beta_B) - scsp.digamma(alpha_A) + scsp.digamma(alpha_A + beta_A)
+    variance = trigamma(alpha_B) - trigamma(alpha_B + beta_B) + trigamma(alpha_A) - trigamma(alpha_A + beta_A)
+    return mean, np.sqrt(variance)
+
+
+def approximate_uplift_probability(mean, standard_deviation, min_uplift=0):
+    """
+    P(B / A - 1 >= min_uplift) for arrays of posteriors of A and B with the log_uplift_moments mean and
+    standard_deviation, approximating log(B) - log(A) by a normal. It costs one array operation per
+    posterior and threshold instead of an integration, close to the analytic engine once each posterior
+    has a few dozen conversions. min_uplift broadcasts against the posteriors
+    """
+    import scipy.special as scsp
+
+    return scsp.ndtr((mean - np.log1p(min_uplift)) / standard_deviation)
+
+
+def plot_histogram_counts(ax, counts, edges, color):
+    """Draws precomputed histogram counts with the same look as the seaborn histograms"""
+    widths = np.diff(edges)
+    ax.bar(edges[:-1] + widths / 2, counts, width=widths * 0.75, color=color, alpha=0.75, edgecolor="black", linewidth=0.1)
+
+
+def trim_histogram(counts, edges):
+    """Drops the empty bins at both ends of a histogram"""
+    filled = np.flatnonzero(counts)
+    if filled.size == 0:
+        return counts, edges
+    return counts[filled[0]:filled[-1] + 1], edges[filled[0]:filled[-1] + 2]
+
+
+def standard_error(probability, num_samples):
+    """Monte Carlo standard error of a probability estimated from num_samples samples"""
+    return np.sqrt(probability * (1 - probability) / num_samples)
+
+
+def chart_values(values):
+    """Rounds values for the JSON sent to the browser, where more digits are never visible"""
+    return np.round(np.asarray(values, dtype=float), 6).tolist()
+
+
+def histogram_series(label, color, fractions, edges):
+    """One series of a histogram chart drawn in the browser"""
+    return {"label": label, "color": color, "edges": chart_values(edges), "values": chart_values(fractions)}
 
 
 """
@@ -13,8 +290,18 @@ Class where all the calculations are encapulated. Bayesian calculations are base
 developed by rjjfox (https://github.com/rjjfox/ab-test-calculator) for a streamlit application
 """
 class bayesCalculations(object):
-    def __init__(self):
-        return
+    def __init__(self, engine="analytic", tolerance=ADAPTIVE_TOLERANCE, max_samples=NUM_POSTERIOR_SAMPLES, seed=None, workers=None):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        self.engine = engine
+        # Standard error targeted by the adaptive engine. max_samples are the samples drawn by the
+        # montecarlo and streaming engines and the cap on the samples the adaptive engine draws
+        self.tolerance = tolerance
+        self.max_samples = max_samples
+        # Seed of the samples, a fresh one is drawn and recorded in sampling_seed if not set, and
+        # threads drawing them, all the cores if not set
+        self.seed = seed
+        self.workers = workers
         
     def setValues(self, visitors_A, conversions_A, visitors_B, conversions_B, test_duration, percent_traffic_in_test, aov, min_rev_yield):
         self.visitors_A = visitors_A
@@ -24,33 +311,228 @@ class bayesCalculations(object):
         self.control_cr = conversions_A / visitors_A
         self.variant_cr = conversions_B / visitors_B
         self.relative_difference = self.variant_cr / self.control_cr - 1
+        self.setProjectionValues(test_duration, percent_traffic_in_test, aov, min_rev_yield)
+
+    def setProjectionValues(self, test_duration, percent_traffic_in_test, aov, min_rev_yield):
+        """Sets the values the revenue projections depend on, which do not change the posteriors"""
         self.test_duration = test_duration
         self.percent_traffic_in_test = percent_traffic_in_test
         self.min_rev_yield = min_rev_yield
         self.aov = aov 
         
-    def generate_posterior_samples(self):
-        """Generates samples for the posterior distributions of A and B."""
-        # Set alpha and beta priors
-        alpha_prior = 1
-        beta_prior = 1
+    def posterior_distributions(self):
+        """Returns the Beta posterior distributions of A and B."""
+        import scipy.stats as scs
 
         # Calculate posterior distribution for A
-        posterior_A = scs.beta(alpha_prior + self.conversions_A,
-                            beta_prior + self.visitors_A - self.conversions_A)
+        posterior_A = scs.beta(ALPHA_PRIOR + self.conversions_A,
+                            BETA_PRIOR + self.visitors_A - self.conversions_A)
 
         # Calculate posterior distribution for B
-        posterior_B = scs.beta(alpha_prior + self.conversions_B,
-                            beta_prior + self.visitors_B - self.conversions_B)
+        posterior_B = scs.beta(ALPHA_PRIOR + self.conversions_B,
+                            BETA_PRIOR + self.visitors_B - self.conversions_B)
+        return posterior_A, posterior_B
+
+    @instr.timed("generate_posterior_samples", lambda calc: {
+        "samples": 2 * calc.num_samples if calc.engine == "montecarlo" else 0,
+        "bytes": instr.array_bytes(calc.samples_posterior_A, calc.samples_posterior_B),
+    })
+    def generate_posterior_samples(self):
+        """
+        Generates samples for the posterior distributions of A and B, from the seed or a fresh one
+        recorded in sampling_seed, so any result can be reproduced. The streaming and adaptive engines
+        draw their samples chunk by chunk in calculate_probabilities instead, and the analytic engine
+        needs none
+        """
+        self.num_samples = self.max_samples
+        self._sorted_difference = None
+        self.sampling_seed = np.random.SeedSequence(self.seed).entropy
+        if self.engine != "montecarlo":
+            self.samples_posterior_A = self.samples_posterior_B = None
+            return
+
+        posterior_A, posterior_B = self.posterior_distributions()
 
         # Generate posterior simulation samples
-        self.samples_posterior_A = posterior_A.rvs(NUM_POSTERIOR_SAMPLES)
-        self.samples_posterior_B = posterior_B.rvs(NUM_POSTERIOR_SAMPLES)
+        self.samples_posterior_A, self.samples_posterior_B = draw_beta_samples(
+            [posterior_A.args[0], posterior_B.args[0]], [posterior_A.args[1], posterior_B.args[1]],
+            self.max_samples, self.sampling_seed, self.workers
+        )
         
     def calculate_probabilities(self):
         """Calculate the likelihood that the variants are better"""
-        
-        # Calculate the probabilities
+        self.calculate_posterior_probabilities()
+        self.calculate_revenue_projections()
+
+    @instr.timed("calculate_posterior_probabilities", lambda calc: {
+        "engine": calc.engine,
+        "samples": 2 * calc.num_samples if calc.engine in STREAMED_ENGINES else 0,
+    })
+    def calculate_posterior_probabilities(self):
+        """
+        Calculate the probabilities and the means for positive and negative relative changes with the
+        selected engine. They only depend on the visitors and conversions
+        """
+        self._histograms = None
+        self._chart_data = {}
+        if self.engine == "analytic":
+            self._calculate_analytic()
+        elif self.engine == "streaming":
+            self._calculate_streaming(self.max_samples, STREAMING_CHUNK_SIZE)
+        elif self.engine == "adaptive":
+            self._calculate_streaming(self.max_samples, ADAPTIVE_BATCH_SIZE, self.tolerance)
+        else:
+            self._calculate_montecarlo()
+
+    @instr.timed("calculate_revenue_projections")
+    def calculate_revenue_projections(self):
+        """
+        Calculate the expected risk, uplift and total contribution in six months and the probability of
+        reaching the minimum revenue yield, from the posterior probabilities already calculated
+        """
+        revenue_in_six_months = self.revenue_in_six_months()
+
+        # Calculate the expected risk and expected uplift
+        self.expected_risk = revenue_in_six_months * self.mean_negative_difference
+        self.expected_uplift = revenue_in_six_months * self.mean_positive_difference
+
+        # Calculate the probability of achieving the minimum uplift
+        self.prob_yield_mean = self.probability_of_uplift(self.minimum_uplift())
+        self.standard_error_prob_yield = 0.0 if self.num_samples == 0 else standard_error(self.prob_yield_mean, self.num_samples)
+
+        # Calculate the total contribution
+        self.total_contribution = self.expected_risk * self.prob_A + self.expected_uplift * self.prob_B
+
+    def cache_inputs(self):
+        """
+        Inputs the posterior state depends on, to address it in a result cache. The sample count and
+        tolerance only matter to the engines that sample
+        """
+        inputs = {
+            "counts": [self.visitors_A, self.conversions_A, self.visitors_B, self.conversions_B],
+            "prior": [ALPHA_PRIOR, BETA_PRIOR],
+            "engine": self.engine,
+            "samples": 0,
+            "seed": self.seed,
+        }
+        if self.engine != "analytic":
+            inputs["samples"] = self.max_samples
+        if self.engine == "adaptive":
+            inputs["tolerance"] = self.tolerance
+        return inputs
+
+    def posterior_state(self):
+        """
+        Everything calculate_posterior_probabilities computed, with the histograms, chart data and
+        threshold index, so that restore_posterior_state can rebuild the calculation without sampling
+        """
+        self.histograms()
+        self.simulation_chart_data()
+        self.difference_chart_data()
+        names = ["prob_A", "prob_B", "mean_positive_difference", "mean_negative_difference",
+                 "standard_error_prob_B", "num_samples", "sampling_seed", "_histograms", "_chart_data"]
+        if self.engine == "analytic":
+            self.difference_survival()
+            names.append("_difference_survival")
+        elif self.engine in STREAMED_ENGINES:
+            names += ["histogram_A", "histogram_B", "histogram_difference", "streamed_min_uplift", "streamed_prob_yield"]
+        else:
+            # The sorted differences answer every threshold, the raw samples are not kept
+            self.sorted_difference()
+            names.append("_sorted_difference")
+        return {name: getattr(self, name) for name in names}
+
+    def restore_posterior_state(self, state):
+        """Sets the results of a previous calculation with the same cache_inputs"""
+        self.samples_posterior_A = self.samples_posterior_B = None
+        self._sorted_difference = self._difference_survival = None
+        self.__dict__.update(state)
+
+    def revenue_in_six_months(self):
+        """Revenue of the control in six months at the traffic and duration of the test"""
+        return visitors_in_six_months(self.visitors_A + self.visitors_B, self.test_duration, self.percent_traffic_in_test) * self.control_cr * self.aov
+
+    def minimum_uplift(self):
+        """Relative change of B over A needed to reach the minimum revenue yield"""
+        return self.min_rev_yield / self.revenue_in_six_months()
+
+    def probability_of_uplift(self, min_uplift):
+        """
+        Probability of the relative change of B over A being at least min_uplift. An array of thresholds
+        is answered in one call, from the analytic CDF, the sorted samples or the histogram depending
+        on the engine, so no threshold needs a pass over the samples
+        """
+        if self.engine == "analytic":
+            if np.ndim(min_uplift) == 0:
+                return self._integrate_uplift(min_uplift)
+            # Arrays of thresholds are read from the tabulated survival function
+            grid, survival = self.difference_survival()
+            return np.interp(min_uplift, grid, survival)
+        if self.engine in STREAMED_ENGINES:
+            if np.ndim(min_uplift) == 0 and min_uplift == self.streamed_min_uplift:
+                return self.streamed_prob_yield
+            # Any other threshold is read from the histogram, interpolating within its bin
+            counts, edges = self.histogram_difference
+            tail_counts = np.cumsum(counts[::-1])[::-1]
+            return np.interp(min_uplift, edges, np.r_[tail_counts, 0]) / self.num_samples
+        sorted_difference = self.sorted_difference()
+        return 1 - np.searchsorted(sorted_difference, min_uplift, side="left") / len(sorted_difference)
+
+    def _integrate_uplift(self, min_uplift):
+        """P(B / A - 1 >= min uplift) = P(B >= (1 + min uplift) * A), for one threshold or an array of them"""
+        posterior_A, posterior_B = self.posterior_distributions()
+        probabilities = uplift_probability(*posterior_A.args, *posterior_B.args, min_uplift)
+        return float(probabilities[0]) if np.ndim(min_uplift) == 0 else probabilities
+
+    def difference_survival(self):
+        """
+        Analytic survival function of the relative change of B over A, tabulated once per posterior
+        on a grid spanning the bulk of the difference. The grid is uniform in log(B / A), which is
+        close to normal, so long right tails of small tests do not leave the bulk with few points
+        """
+        if self._difference_survival is None:
+            with instr.stage("difference_survival", bytes=2 * 8 * QUANTILE_GRID_POINTS):
+                posterior_A, posterior_B = self.posterior_distributions()
+                lower_A, upper_A = posterior_A.ppf([HISTOGRAM_TAIL, 1 - HISTOGRAM_TAIL])
+                lower_B, upper_B = posterior_B.ppf([HISTOGRAM_TAIL, 1 - HISTOGRAM_TAIL])
+                grid = np.exp(np.linspace(np.log(lower_B / upper_A), np.log(upper_B / lower_A), QUANTILE_GRID_POINTS)) - 1
+                self._difference_survival = (grid, self._integrate_uplift(grid))
+        return self._difference_survival
+
+    def sorted_difference(self):
+        """Sorted relative changes of the posterior samples, built once per set of samples"""
+        if self._sorted_difference is None:
+            with instr.stage("sorted_difference") as details:
+                self._sorted_difference = np.sort(self.samples_posterior_B / self.samples_posterior_A - 1)
+                if details is not None:
+                    details["bytes"] = self._sorted_difference.nbytes
+        return self._sorted_difference
+
+    def uplift_probability_curve(self, min_rev_yields):
+        """Probability of reaching each of the minimum revenue yields in six months"""
+        return self.probability_of_uplift(np.asarray(min_rev_yields, dtype=float) / self.revenue_in_six_months())
+
+    def uplift_quantiles(self, probabilities):
+        """Quantiles of the relative change of B over A"""
+        probabilities = np.asarray(probabilities, dtype=float)
+        if self.engine == "analytic":
+            grid, survival = self.difference_survival()
+            return np.interp(probabilities, 1 - survival, grid)
+        if self.engine in STREAMED_ENGINES:
+            counts, edges = self.histogram_difference
+            return np.interp(probabilities, np.r_[0, np.cumsum(counts)] / counts.sum(), edges)
+        sorted_difference = self.sorted_difference()
+        return np.interp(probabilities * (len(sorted_difference) - 1), np.arange(len(sorted_difference)), sorted_difference)
+
+    def credible_interval(self, mass=0.95):
+        """Equal-tailed credible interval of the relative change of B over A"""
+        return tuple(self.uplift_quantiles([(1 - mass) / 2, (1 + mass) / 2]))
+
+    def _calculate_montecarlo(self):
+        """
+        Estimates the probabilities and the means of the positive and negative relative changes
+        from the posterior samples
+        """
         self.prob_A = (self.samples_posterior_A > self.samples_posterior_B).mean()
         self.prob_B = (self.samples_posterior_A <= self.samples_posterior_B).mean()
         
@@ -58,35 +540,207 @@ class bayesCalculations(object):
         difference = self.samples_posterior_B / self.samples_posterior_A - 1
         self.greater = difference[difference > 0]
         self.lower = difference[difference < 0]
-        # Calculate means for positive and negative relative changes
-        mean_positive_difference = 0 if self.greater.size == 0 else self.greater.mean()
-        mean_negative_difference = 0 if self.lower.size == 0 else self.lower.mean()
-
-        # Calculate the number of visitors and revenue in six months
-        six_months_in_days = 182.5
-        visitors_in_six_months = (self.visitors_A + self.visitors_B) / (self.percent_traffic_in_test / 100) / self.test_duration * six_months_in_days
-        revenue_in_six_months = visitors_in_six_months * self.control_cr * self.aov 
-        
-        # Calculate the expected risk and expected uplift
-        self.expected_risk = revenue_in_six_months * mean_negative_difference
-        self.expected_uplift = revenue_in_six_months * mean_positive_difference
-        
-        # Calculate the minimum uplift probability
-        min_uplift_prob = self.min_rev_yield / revenue_in_six_months 
-        
-        # Calculate the probability of achieving the minimum uplift
-        self.prob_yield_mean = (difference >= min_uplift_prob).mean()
-        
-        # Calculate the total contribution
-        self.total_contribution = self.expected_risk * self.prob_A + self.expected_uplift * self.prob_B
+        self.standard_error_prob_B = standard_error(self.prob_B, self.num_samples)
+
+        self.mean_positive_difference = 0 if self.greater.size == 0 else self.greater.mean()
+        self.mean_negative_difference = 0 if self.lower.size == 0 else self.lower.mean()
+
+    def _calculate_streaming(self, max_samples, chunk_size, tolerance=None):
+        """
+        Estimates the probabilities and the means of the positive and negative relative changes from
+        posterior samples drawn in chunks, reducing each chunk into running counts, sums and histogram
+        counts. The probability of the minimum uplift for the current revenue values is counted while
+        streaming, other thresholds are read from the histogram. With a tolerance, sampling stops as
+        soon as the standard errors of prob_B and of that probability fall below it
+        """
+        posterior_A, posterior_B = self.posterior_distributions()
+        self.streamed_min_uplift = min_uplift_prob = self.minimum_uplift()
+        self.num_samples = 0
+        edges_A, edges_B, edges_difference = self._histogram_edges(posterior_A, posterior_B)
+        counts_A = np.zeros(len(edges_A) - 1)
+        counts_B = np.zeros(len(edges_B) - 1)
+        counts_difference = np.zeros(len(edges_difference) - 1)
+        count_B = count_yield = count_positive = count_negative = 0
+        sum_positive = sum_negative = 0.0
+        # Every chunk is drawn from its own stream, spawned in order from the sampling seed, which is
+        # resolved here when generate_posterior_samples was not called, as these engines need no samples before
+        if getattr(self, "sampling_seed", None) is None:
+            self.sampling_seed = np.random.SeedSequence(self.seed).entropy
+        seed = np.random.SeedSequence(self.sampling_seed)
+
+        while self.num_samples < max_samples:
+            size = min(chunk_size, max_samples - self.num_samples)
+            samples_A, samples_B = draw_beta_samples(
+                [posterior_A.args[0], posterior_B.args[0]], [posterior_A.args[1], posterior_B.args[1]],
+                size, seed.spawn(1)[0], self.workers
+            )
+            difference = samples_B / samples_A - 1
+
+            count_B += np.count_nonzero(samples_A <= samples_B)
+            count_yield += np.count_nonzero(difference >= min_uplift_prob)
+            positive = difference > 0
+            negative = difference < 0
+            count_positive += np.count_nonzero(positive)
+            count_negative += np.count_nonzero(negative)
+            sum_positive += difference[positive].sum()
+            sum_negative += difference[negative].sum()
+
+            counts_A += np.histogram(samples_A, edges_A)[0]
+            counts_B += np.histogram(samples_B, edges_B)[0]
+            counts_difference += np.histogram(difference, edges_difference)[0]
+
+            self.num_samples += size
+            self.prob_B = count_B / self.num_samples
+            self.streamed_prob_yield = count_yield / self.num_samples
+            self.standard_error_prob_B = standard_error(self.prob_B, self.num_samples)
+            if tolerance is not None and max(self.standard_error_prob_B, standard_error(self.streamed_prob_yield, self.num_samples)) <= tolerance:
+                break
+
+        self.prob_A = 1 - self.prob_B
+        self.histogram_A = trim_histogram(counts_A, edges_A)
+        self.histogram_B = trim_histogram(counts_B, edges_B)
+        self.histogram_difference = trim_histogram(counts_difference, edges_difference)
 
+        self.mean_positive_difference = 0 if count_positive == 0 else sum_positive / count_positive
+        self.mean_negative_difference = 0 if count_negative == 0 else sum_negative / count_negative
+
+    def _histogram_edges(self, posterior_A, posterior_B):
+        """
+        Bin edges for the histograms of A, B and their relative difference, spanning the bulk of
+        the posteriors so that they are known before any sample is drawn
+        """
+        lower_A, upper_A = posterior_A.ppf([HISTOGRAM_TAIL, 1 - HISTOGRAM_TAIL])
+        lower_B, upper_B = posterior_B.ppf([HISTOGRAM_TAIL, 1 - HISTOGRAM_TAIL])
+        edges_A = np.linspace(lower_A, upper_A, HISTOGRAM_BINS + 1)
+        edges_B = np.linspace(lower_B, upper_B, HISTOGRAM_BINS + 1)
+
+        # Difference bins are aligned on multiples of the bin width so that zero is always an edge, and
+        # widened in multiples of DIFFERENCE_BINWIDTH to stay within MAX_STREAMED_DIFFERENCE_BINS
+        lower_ratio, upper_ratio = lower_B / upper_A - 1, upper_B / lower_A - 1
+        binwidth = DIFFERENCE_BINWIDTH * max(1, np.ceil((upper_ratio - lower_ratio) / DIFFERENCE_BINWIDTH / MAX_STREAMED_DIFFERENCE_BINS))
+        edges_difference = np.arange(np.floor(lower_ratio / binwidth), np.ceil(upper_ratio / binwidth) + 1) * binwidth
+        return edges_A, edges_B, edges_difference
+
+    def _calculate_analytic(self):
+        """
+        Computes the probabilities and the means of the positive and negative relative changes by
+        integrating over the density of A, with the distribution of B evaluated in closed form
+        """
+        posterior_A, posterior_B = self.posterior_distributions()
+        prob_B, positive_difference, negative_difference = (
+            float(value[0]) for value in posterior_statistics(*posterior_A.args, *posterior_B.args)
+        )
+
+        # P(B >= A)
+        self.prob_B = prob_B
+        self.prob_A = 1 - self.prob_B
+        self.num_samples = 0
+        self.standard_error_prob_B = 0.0
+        self._difference_survival = None
+
+        # E[B / A - 1; B > A] and E[B / A - 1; B < A], conditioned on the sign of the difference
+        self.mean_positive_difference = 0 if self.prob_B == 0 else positive_difference / self.prob_B
+        self.mean_negative_difference = 0 if self.prob_A == 0 else negative_difference / self.prob_A
+
+    def histograms(self):
+        """
+        Histograms of A, B and their relative difference as (fraction of samples per bin, bin edges),
+        computed once per calculation so the plots never bin raw samples. The posterior bins come from
+        the Beta CDFs, the samples or the streamed counts depending on the engine. The difference bins
+        span its central quantiles with at most MAX_DIFFERENCE_BINS bins of a multiple of
+        DIFFERENCE_BINWIDTH, and their fractions come from the threshold index of probability_of_uplift
+        """
+        if self._histograms is None:
+            with instr.stage("histograms"):
+                posterior_A, posterior_B = self.posterior_distributions()
+                edges_A, edges_B = self._histogram_edges(posterior_A, posterior_B)[:2]
+                if self.engine == "analytic":
+                    fractions_A = np.diff(posterior_A.cdf(edges_A))
+                    fractions_B = np.diff(posterior_B.cdf(edges_B))
+                elif self.engine in STREAMED_ENGINES:
+                    (fractions_A, edges_A), (fractions_B, edges_B) = self.histogram_A, self.histogram_B
+                    fractions_A, fractions_B = fractions_A / self.num_samples, fractions_B / self.num_samples
+                else:
+                    fractions_A = np.histogram(self.samples_posterior_A, edges_A)[0] / len(self.samples_posterior_A)
+                    fractions_B = np.histogram(self.samples_posterior_B, edges_B)[0] / len(self.samples_posterior_B)
+
+                lower, upper = self.uplift_quantiles([DIFFERENCE_PLOT_TAIL, 1 - DIFFERENCE_PLOT_TAIL])
+                binwidth = DIFFERENCE_BINWIDTH * max(1, np.ceil((upper - lower) / DIFFERENCE_BINWIDTH / MAX_DIFFERENCE_BINS))
+                edges_difference = np.arange(np.floor(lower / binwidth), np.ceil(upper / binwidth) + 1) * binwidth
+                fractions_difference = -np.diff(self.probability_of_uplift(edges_difference))
+
+                self._histograms = {
+                    "A": trim_histogram(fractions_A, edges_A),
+                    "B": trim_histogram(fractions_B, edges_B),
+                    "difference": trim_histogram(fractions_difference, edges_difference),
+                }
+        return self._histograms
+
+    def probabilities_chart_data(self, labels=["A", "B"]):
+        """Data of the chance of being best chart, for the charts drawn in the browser"""
+        return {
+            "type": "bars",
+            "labels": labels,
+            "values": chart_values([self.prob_A, self.prob_B]),
+            "colors": ["#da6d75", "#51c4a8"],
+        }
+
+    def simulation_chart_data(self):
+        """Data of the histograms of A and B, for the charts drawn in the browser"""
+        if "simulation" in self._chart_data:
+            return self._chart_data["simulation"]
+        histograms = self.histograms()
+        self._chart_data["simulation"] = {
+            "type": "histogram",
+            "legend": True,
+            "series": [
+                histogram_series("distribution A", "#da6d75", *histograms["A"]),
+                histogram_series("distribution B", "#51c4a8", *histograms["B"]),
+            ],
+        }
+        return self._chart_data["simulation"]
+
+    def difference_chart_data(self):
+        """Data of the histogram of the difference, split at zero, for the charts drawn in the browser"""
+        if "difference" in self._chart_data:
+            return self._chart_data["difference"]
+        fractions, edges = self.histograms()["difference"]
+        zero = np.count_nonzero(edges[:-1] < 0)
+        self._chart_data["difference"] = {
+            "type": "histogram",
+            "legend": False,
+            "series": [
+                histogram_series("negative", "#da6d75", fractions[:zero], edges[:zero + 1]),
+                histogram_series("positive", "#51c4a8", fractions[zero:], edges[zero:]),
+            ],
+        }
+        return self._chart_data["difference"]
+
+    def yield_curve_chart_data(self, currency="€"):
+        """Data of the minimum revenue yield curve, for the charts drawn in the browser"""
+        yields = np.linspace(0, self.yield_curve_upper_limit(), YIELD_CURVE_POINTS)
+        return {
+            "type": "line",
+            "x": chart_values(yields),
+            "y": chart_values(self.uplift_probability_curve(yields)),
+            "color": "#51c4a8",
+            "marker": {"x": self.min_rev_yield, "y": chart_values(self.prob_yield_mean), "color": "#da6d75"},
+            "currency": currency,
+        }
+
+    def yield_curve_upper_limit(self):
+        """Covers the yields up to the 99.9% quantile of the uplift, or twice the selected one"""
+        return max(self.uplift_quantiles(0.999) * self.revenue_in_six_months(), 2 * self.min_rev_yield, 1)
+
+    @instr.timed("plot_bayesian_probabilities")
     def plot_bayesian_probabilities(self, labels=["A", "B"]):
         """
         Plots a horizontal bar chart of the likelihood of either variant being
         the winner
         """
+        mtick, sns = plotting()
 
-        fig, ax = plt.subplots(figsize=(10, 4), dpi=75)
+        fig, ax = new_figure(figsize=(10, 4))
         ax.patch.set_alpha(0.8)
         
         snsplot = ax.barh(
@@ -139,70 +793,98 @@ class bayesCalculations(object):
         ax.tick_params(axis='x', colors='#595959')
         ax.set_axisbelow(True)
         ax.xaxis.set_major_formatter(mtick.PercentFormatter(1))
-        sns.despine(left=True, bottom=True)
+        sns.despine(ax=ax, left=True, bottom=True)
         ax.tick_params(axis="both", which="both", bottom=False, left=False)
         fig.tight_layout()
         return fig
 
+    @instr.timed("plot_yield_curve")
+    def plot_yield_curve(self, currency="€"):
+        """
+        Plots the probability of reaching each minimum revenue yield in six months, marking the
+        selected minimum yield
+        """
+        mtick, sns = plotting()
+
+        fig, ax = new_figure(figsize=(10, 4))
+        ax.patch.set_alpha(0.8)
+
+        yields = np.linspace(0, self.yield_curve_upper_limit(), YIELD_CURVE_POINTS)
+        ax.plot(yields, self.uplift_probability_curve(yields), color="#51c4a8", linewidth=2)
+        ax.axvline(self.min_rev_yield, color="#da6d75", linestyle="--", linewidth=1)
+        ax.text(self.min_rev_yield, self.prob_yield_mean, f" {self.prob_yield_mean:.1%}", color="#595959", **roboto)
+
+        ax.yaxis.grid(color="lightgrey")
+        ax.set_axisbelow(True)
+        sns.despine(ax=ax, left=True)
+        ax.set_ylim(0, 1.05)
+        ax.tick_params(axis="y", colors="lightgrey")
+        ax.tick_params(axis='x', colors='#595959')
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter(1))
+        ax.xaxis.set_major_formatter(mtick.FuncFormatter(lambda x, p: currency + format(x, ",.0f")))
+        fig.tight_layout()
+        return fig
+
+    @instr.timed("plot_simulation")
     def plot_simulation(self):
         """
         Plots a histogram showing the distribution of A and B
         highlighting the difference between them
         """
+        mtick, sns = plotting()
 
-        fig, ax = plt.subplots(figsize=(10, 4), dpi=75)
+        fig, ax = new_figure(figsize=(10, 4))
         ax.patch.set_alpha(0.8)
 
-        sns.histplot(self.samples_posterior_A, bins=50, color="#da6d75", shrink=0.75, edgecolor="black", linewidth=0.1)
-        sns.histplot(self.samples_posterior_B, bins=50, color="#51c4a8", shrink=0.75, edgecolor="black", linewidth=0.1)
+        histograms = self.histograms()
+        plot_histogram_counts(ax, *histograms["A"], "#da6d75")
+        plot_histogram_counts(ax, *histograms["B"], "#51c4a8")
 
         ax.get_yaxis().set_major_formatter(
-            mtick.FuncFormatter(lambda x, p: format(x / len(self.samples_posterior_A), ".0%"))
+            mtick.FuncFormatter(lambda x, p: format(x, ".0%"))
         )
 
-        plt.legend(labels=["distribution A", "distribution B"], loc = "lower center", bbox_to_anchor=(0.5, -0.4), ncol=2, frameon=False, handleheight=1.25, handlelength=1)
+        ax.legend(labels=["distribution A", "distribution B"], loc = "lower center", bbox_to_anchor=(0.5, -0.4), ncol=2, frameon=False, handleheight=1.25, handlelength=1)
 
         # Set grid lines as grey and display behind the plot
         ax.yaxis.grid(color="lightgrey")
         ax.set_axisbelow(True)
 
         # Remove y axis line and label and dim the tick labels
-        sns.despine(left=True)
+        sns.despine(ax=ax, left=True)
         ax.set_ylabel("")
         ax.tick_params(axis="y", colors="lightgrey")
         ax.tick_params(axis='x', colors='#595959')
         ax.tick_params(axis='x', which='minor', colors='#595959', pad=4.9)
     
         ax.xaxis.set_major_formatter(mtick.PercentFormatter(1))
-        ax.xaxis.set_minor_locator(AutoMinorLocator(2))
+        ax.xaxis.set_minor_locator(mtick.AutoMinorLocator(2))
         ax.xaxis.set_minor_formatter(mtick.PercentFormatter(1))
         fig.tight_layout()
+        return fig
 
+    @instr.timed("plot_simulation_of_difference")
     def plot_simulation_of_difference(self):
         """
         Plots a histogram showing the distribution of the differences between
         A and B highlighting how much of the difference shows a positve diff
         vs a negative one.
         """
+        mtick, sns = plotting()
 
-        fig, ax = plt.subplots(figsize=(10, 4), dpi=75)
+        fig, ax = new_figure(figsize=(10, 4))
         ax.patch.set_alpha(0.8)
 
-        difference = self.samples_posterior_B / self.samples_posterior_A - 1
-
-        greater = difference[difference > 0]
-        lower = difference[difference < 0]
-
-        sns.histplot(greater, binwidth=0.005, color="#51c4a8", shrink=0.75, edgecolor="black", linewidth=0.1)
-
-        if lower.size != 0:
-            lower_limit = round(lower.min(), 2)
-            sns.histplot(
-                lower, binwidth=0.005, binrange=(lower_limit, 0), color="#da6d75", shrink=0.75, edgecolor="black", linewidth=0.1
-            )
+        # Split the histogram at zero, which is always a bin edge
+        fractions, edges = self.histograms()["difference"]
+        zero = np.count_nonzero(edges[:-1] < 0)
+        if fractions[zero:].sum() > 0:
+            plot_histogram_counts(ax, fractions[zero:], edges[zero:], "#51c4a8")
+        if fractions[:zero].sum() > 0:
+            plot_histogram_counts(ax, fractions[:zero], edges[:zero + 1], "#da6d75")
 
         ax.get_yaxis().set_major_formatter(
-            mtick.FuncFormatter(lambda x, p: format(x / len(difference), ".0%"))
+            mtick.FuncFormatter(lambda x, p: format(x, ".0%"))
         )
 
         # Set grid lines as grey and display behind the plot
@@ -210,14 +892,523 @@ class bayesCalculations(object):
         ax.set_axisbelow(True)
 
         # Remove y axis line and label and dim the tick labels
-        sns.despine(left=True)
+        sns.despine(ax=ax, left=True)
         ax.set_ylabel("")
         ax.tick_params(axis="y", colors="lightgrey")
         ax.tick_params(axis='x', colors='#595959')
         ax.tick_params(axis='x', which='minor', colors='#595959', pad=4.9)
     
         ax.xaxis.set_major_formatter(mtick.PercentFormatter(1))
-        ax.xaxis.set_minor_locator(AutoMinorLocator(2))
+        ax.xaxis.set_minor_locator(mtick.AutoMinorLocator(2))
         ax.xaxis.set_minor_formatter(mtick.PercentFormatter(1))
         fig.tight_layout()
+        return fig
+
+
+
+"""
+Class for tests with more than two variants. All the posteriors are sampled into a single
+(arms x samples) matrix, so every statistic is one pass over it instead of pairwise comparisons
+"""
+class bayesMultiArmCalculations(object):
+    def __init__(self, seed=None, workers=None):
+        # Seed of the samples, recorded in sampling_seed when drawn if not set, and threads drawing them
+        self.seed = seed
+        self.workers = workers
+
+    def setValues(self, visitors, conversions, labels=None):
+        self.visitors = np.asarray(visitors)
+        self.conversions = np.asarray(conversions)
+        if self.visitors.shape != self.conversions.shape or self.visitors.size < 2:
+            raise ValueError("Expected the same number of visitors and conversions for at least two variants")
+        self.labels = list(ARM_LABELS[:self.visitors.size]) if labels is None else list(labels)
+        self.conversion_rates = self.conversions / self.visitors
+
+    @instr.timed("multi_arm_generate_posterior_samples", lambda calc: {
+        "samples": calc.samples_posterior.size, "bytes": calc.samples_posterior.nbytes,
+    })
+    def generate_posterior_samples(self):
+        """Generates the samples of all the posterior distributions in a single call"""
+        self.sampling_seed = np.random.SeedSequence(self.seed).entropy
+        self.samples_posterior = draw_beta_samples(ALPHA_PRIOR + self.conversions,
+                                                   BETA_PRIOR + self.visitors - self.conversions,
+                                                   NUM_POSTERIOR_SAMPLES, self.sampling_seed, self.workers)
+
+    @instr.timed("multi_arm_calculate_probabilities")
+    def calculate_probabilities(self):
+        """Calculate the likelihood of each variant being the best and its expected loss against the best"""
+        best = self.samples_posterior.max(axis=0)
+        self.prob_best = np.bincount(self.samples_posterior.argmax(axis=0), minlength=self.visitors.size) / NUM_POSTERIOR_SAMPLES
+
+        # E[max - arm] is E[max] - E[arm], so the loss needs no second matrix
+        self.expected_loss = best.mean() - self.samples_posterior.mean(axis=1)
+        self.relative_expected_loss = self.expected_loss / self.conversion_rates
+
+    def cache_inputs(self):
+        """Inputs the probabilities depend on, to address them in a result cache. Labels only name the variants"""
+        return {
+            "visitors": self.visitors,
+            "conversions": self.conversions,
+            "prior": [ALPHA_PRIOR, BETA_PRIOR],
+            "samples": NUM_POSTERIOR_SAMPLES,
+            "seed": self.seed,
+        }
+
+    def posterior_state(self):
+        """Results of calculate_probabilities, without the samples"""
+        return {name: getattr(self, name) for name in ["prob_best", "expected_loss", "relative_expected_loss", "sampling_seed"]}
+
+    def restore_posterior_state(self, state):
+        """Sets the results of a previous calculation with the same cache_inputs"""
+        self.samples_posterior = None
+        self.__dict__.update(state)
+
+    def probabilities_chart_data(self):
+        """Data of the chance of being best chart, for the charts drawn in the browser"""
+        return {
+            "type": "bars",
+            "labels": self.labels,
+            "values": chart_values(self.prob_best),
+            "colors": ["#51c4a8" if prob == self.prob_best.max() else "#da6d75" for prob in self.prob_best],
+        }
+
+    @instr.timed("multi_arm_plot_bayesian_probabilities")
+    def plot_bayesian_probabilities(self):
+        """
+        Plots a horizontal bar chart of the likelihood of each variant being
+        the winner
+        """
+        mtick, sns = plotting()
+
+        fig, ax = new_figure(figsize=(10, 1 + 0.75 * len(self.labels)))
+        ax.patch.set_alpha(0.8)
+
+        colors = ["#51c4a8" if prob == self.prob_best.max() else "#da6d75" for prob in self.prob_best]
+        snsplot = ax.barh(self.labels[::-1], self.prob_best[::-1], color=colors[::-1])
+
+        # Display the probabilities inside long bars and next to short ones
+        for patch, prob in zip(snsplot.patches, self.prob_best[::-1]):
+            ax.text(
+                prob - 0.01 if prob >= 0.2 else prob + 0.01,
+                patch.get_y() + patch.get_height() / 2.1,
+                f"{prob:.1%}",
+                horizontalalignment="right" if prob >= 0.2 else "left",
+                color="white" if prob >= 0.2 else "black",
+                **roboto,
+            )
+
+        ax.xaxis.grid(color="lightgrey")
+        ax.tick_params(axis='x', colors='#595959')
+        ax.set_axisbelow(True)
+        ax.xaxis.set_major_formatter(mtick.PercentFormatter(1))
+        sns.despine(ax=ax, left=True, bottom=True)
+        ax.tick_params(axis="both", which="both", bottom=False, left=False)
+        fig.tight_layout()
+        return fig
+
+
+"""
+Class for monitoring a running test from the visitors and conversions of every period (a day by
+default). The posteriors are updated with the increments, so the results of all the periods are one
+vectorised pass over the running totals and appending a period only calculates that period
+"""
+class bayesSequentialCalculations(object):
+    SERIES = ["visitors_A", "conversions_A", "visitors_B", "conversions_B", "prob_A", "prob_B",
+              "mean_positive_difference", "mean_negative_difference", "expected_risk", "expected_uplift", "total_contribution"]
+
+    def __init__(self, period_days=1):
+        # Length of a period in days, 1 / 24 for hourly data
+        self.period_days = period_days
+
+    def setValues(self, visitors_A, conversions_A, visitors_B, conversions_B, percent_traffic_in_test, aov, labels=None):
+        """Visitors and conversions of every period, not cumulative, and optional labels of the periods"""
+        increments = [np.asarray(values) for values in (visitors_A, conversions_A, visitors_B, conversions_B)]
+        if len({values.shape for values in increments}) > 1 or increments[0].ndim != 1:
+            raise ValueError("Expected the same number of periods for the visitors and conversions of A and B")
+        if any(np.any(values < 0) for values in increments) or np.any(increments[1] > increments[0]) or np.any(increments[3] > increments[2]):
+            raise ValueError("Expected non negative increments with no more conversions than visitors")
+        self.increments = [values.tolist() for values in increments]
+        # Running totals after the last period, so appending a period never sums the earlier ones
+        self.totals = [values.sum().item() for values in increments]
+        self.labels = list(range(1, len(increments[0]) + 1)) if labels is None else list(labels)
+        self.series = {name: [] for name in self.SERIES}
+        self.setProjectionValues(percent_traffic_in_test, aov)
+
+    def setProjectionValues(self, percent_traffic_in_test, aov):
+        """Sets the values the revenue projections depend on, which do not change the posteriors"""
+        self.percent_traffic_in_test = percent_traffic_in_test
+        self.aov = aov
+
+    @instr.timed("sequential_calculate_probabilities", lambda calc: {"periods": len(calc.labels)})
+    def calculate_probabilities(self):
+        """Posterior probabilities and revenue projections after every period, in one vectorised pass"""
+        totals = [np.cumsum(values) for values in self.increments]
+        self.series = {name: [] for name in self.SERIES}
+        self._extend(*totals, np.arange(1, len(self.labels) + 1) * self.period_days)
+
+    def append(self, visitors_A, conversions_A, visitors_B, conversions_B, label=None):
+        """
+        Adds the visitors and conversions of a new period, calculating that period only. If the earlier
+        periods were not calculated yet, all of them are calculated with it
+        """
+        increment = [visitors_A, conversions_A, visitors_B, conversions_B]
+        if min(increment) < 0 or conversions_A > visitors_A or conversions_B > visitors_B:
+            raise ValueError("Expected non negative increments with no more conversions than visitors")
+        calculated = len(self.series["prob_B"]) == len(self.labels)
+        for values, value in zip(self.increments, increment):
+            values.append(value)
+        self.totals = [total + value for total, value in zip(self.totals, increment)]
+        self.labels.append(len(self.labels) + 1 if label is None else label)
+        if calculated:
+            self._extend(*[np.array([total]) for total in self.totals], np.array([len(self.labels) * self.period_days]))
+        else:
+            self.calculate_probabilities()
+
+    def _extend(self, visitors_A, conversions_A, visitors_B, conversions_B, days):
+        """Appends the results for the running totals of some periods to the series"""
+        summary = posterior_summary(visitors_A, conversions_A, visitors_B, conversions_B, days, self.percent_traffic_in_test, self.aov)
+        for name, values in zip(self.SERIES, [visitors_A, conversions_A, visitors_B, conversions_B]):
+            self.series[name].extend(values.tolist())
+        for name in self.SERIES[4:]:
+            self.series[name].extend(summary[name].tolist())
+
+    def timeline(self):
+        """Every series as an array with one value per period"""
+        return {"period": np.asarray(self.labels), **{name: np.asarray(values) for name, values in self.series.items()}}
+
+    def probability_chart_data(self):
+        """Data of the probability of B being best over time, for the charts drawn in the browser"""
+        prob_B = self.series["prob_B"]
+        return {
+            "type": "line",
+            "x": list(range(len(prob_B))),
+            "xLabels": [str(label) for label in self.labels],
+            "y": chart_values(prob_B),
+            "color": "#51c4a8",
+            "reference": 0.5,
+        }
+
+    @instr.timed("plot_probability_over_time")
+    def plot_probability_over_time(self):
+        """
+        Plots the probability of B being the best experience after every period
+        """
+        mtick, sns = plotting()
+
+        fig, ax = new_figure(figsize=(10, 4))
+        ax.patch.set_alpha(0.8)
+
+        periods = np.arange(len(self.labels))
+        ax.plot(periods, self.series["prob_B"], color="#51c4a8", linewidth=2, marker="o", markersize=3)
+        ax.axhline(0.5, color="#da6d75", linestyle="--", linewidth=1)
+        ticks = periods[::max(1, len(periods) // 10)]
+        ax.set_xticks(ticks, [str(self.labels[i]) for i in ticks])
+
+        ax.yaxis.grid(color="lightgrey")
+        ax.set_axisbelow(True)
+        sns.despine(ax=ax, left=True)
+        ax.set_ylim(0, 1.05)
+        ax.tick_params(axis="y", colors="lightgrey")
+        ax.tick_params(axis='x', colors='#595959')
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter(1))
+        fig.tight_layout()
+        return fig
+
+
+"""
+Class for the result of one test split by segments, as device, country or channel. All the segments
+are calculated analytically in one batched pass, so no segment needs posterior samples
+"""
+class bayesSegmentCalculations(object):
+    def __init__(self):
+        return
+
+    def setValues(self, segments, visitors_A, conversions_A, visitors_B, conversions_B, test_duration, percent_traffic_in_test, aov):
+        """Labels, visitors and conversions of every segment, with the values of the whole test"""
+        self.segments = list(segments)
+        self.visitors_A, self.conversions_A, self.visitors_B, self.conversions_B = (
+            np.asarray(values) for values in (visitors_A, conversions_A, visitors_B, conversions_B)
+        )
+        counts = [self.visitors_A, self.conversions_A, self.visitors_B, self.conversions_B]
+        if any(values.shape != (len(self.segments),) for values in counts):
+            raise ValueError("Expected the visitors and conversions of A and B of every segment")
+        if any(np.any(values < 0) for values in counts) or np.any(self.conversions_A > self.visitors_A) or np.any(self.conversions_B > self.visitors_B):
+            raise ValueError("Expected non negative counts with no more conversions than visitors")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.control_cr = self.conversions_A / self.visitors_A
+            self.variant_cr = self.conversions_B / self.visitors_B
+            self.relative_difference = self.variant_cr / self.control_cr - 1
+        self.test_duration = test_duration
+        self.percent_traffic_in_test = percent_traffic_in_test
+        self.aov = aov
+
+    @instr.timed("segment_calculate_probabilities", lambda calc: {"segments": len(calc.segments)})
+    def calculate_probabilities(self):
+        """Probabilities, mean relative changes and revenue projections of every segment"""
+        self.__dict__.update(posterior_summary(self.visitors_A, self.conversions_A, self.visitors_B, self.conversions_B,
+                                               self.test_duration, self.percent_traffic_in_test, self.aov))
+
+    def table(self):
+        """One array per column with a row per segment"""
+        columns = ["visitors_A", "conversions_A", "visitors_B", "conversions_B", "control_cr", "variant_cr",
+                   "relative_difference", "prob_B", "expected_risk", "expected_uplift", "total_contribution"]
+        return {"segment": np.asarray(self.segments), **{name: getattr(self, name) for name in columns}}
+
+
+"""
+Class for planning how much longer a test needs to run. Futures of the test are simulated from the
+current posteriors at its current traffic, and every simulated future is evaluated after each extra
+day in one vectorised pass, so the days and visitors needed to reach a target probability are read
+from the whole sweep at once
+"""
+class bayesPlanningCalculations(object):
+    def __init__(self, num_simulations=PLANNING_SIMULATIONS, max_days=PLANNING_MAX_DAYS, seed=None):
+        self.num_simulations = num_simulations
+        self.max_days = max_days
+        # Seed of the simulated futures, a fresh one is drawn and recorded in sampling_seed if not set
+        self.seed = seed
+
+    def setValues(self, visitors_A, conversions_A, visitors_B, conversions_B, test_duration, percent_traffic_in_test):
+        """Visitors and conversions so far, with the duration and traffic of the test they come from"""
+        counts = [visitors_A, conversions_A, visitors_B, conversions_B]
+        if min(counts) < 0 or conversions_A > visitors_A or conversions_B > visitors_B or test_duration <= 0:
+            raise ValueError("Expected non negative counts with no more conversions than visitors and a positive duration")
+        self.visitors_A = visitors_A
+        self.conversions_A = conversions_A
+        self.visitors_B = visitors_B
+        self.conversions_B = conversions_B
+        self.test_duration = test_duration
+        self.percent_traffic_in_test = percent_traffic_in_test
+
+    def setProjectionValues(self, aov, min_rev_yield):
+        """AOV and minimum revenue yield, which only the yield probabilities of the simulated futures depend on"""
+        self.aov = aov
+        self.min_rev_yield = min_rev_yield
+
+    @instr.timed("planning_simulate_futures", lambda calc: {
+        "samples": calc.num_simulations * len(calc.days),
+        "bytes": instr.array_bytes(calc.prob_B, calc.control_cr, *calc.log_uplift_moments),
+    })
+    def simulate_futures(self):
+        """
+        Simulates the conversions of the extra days of every future from conversion rates drawn from
+        the posteriors, and the probability of B being best of every future after each extra day
+        """
+        self.sampling_seed = np.random.SeedSequence(self.seed).entropy
+        rng = np.random.default_rng(self.sampling_seed)
+        self.days = np.arange(self.max_days + 1)
+
+        totals = []
+        for visitors, conversions in [(self.visitors_A, self.conversions_A), (self.visitors_B, self.conversions_B)]:
+            # Visitors after every extra day at the current daily traffic, and their simulated conversions
+            future_visitors = visitors + np.rint(visitors / self.test_duration * self.days)
+            rate = rng.beta(ALPHA_PRIOR + conversions, BETA_PRIOR + visitors - conversions, size=(self.num_simulations, 1))
+            daily_conversions = rng.binomial(np.diff(future_visitors).astype(np.int64), rate)
+            future_conversions = conversions + np.hstack([np.zeros((self.num_simulations, 1)), np.cumsum(daily_conversions, axis=1)])
+            totals += [future_visitors, future_conversions]
+        visitors_A, conversions_A, visitors_B, conversions_B = totals
+        self.visitors = visitors_A + visitors_B
+
+        self.control_cr = conversions_A / visitors_A if self.visitors_A > 0 else np.zeros_like(conversions_A)
+        # The posteriors of the futures are kept as their moments, so new minimum yields cost one pass over them
+        self.log_uplift_moments = log_uplift_moments(ALPHA_PRIOR + conversions_A, BETA_PRIOR + visitors_A - conversions_A,
+                                                     ALPHA_PRIOR + conversions_B, BETA_PRIOR + visitors_B - conversions_B)
+        self.prob_B = approximate_uplift_probability(*self.log_uplift_moments)
+
+    @instr.timed("planning_calculate_yield_probabilities")
+    def calculate_yield_probabilities(self):
+        """Probability of reaching the minimum revenue yield of every simulated future after each extra day"""
+        # Minimum uplift of every future, as bayesCalculations.minimum_uplift at the duration of each day
+        revenue_in_six_months = visitors_in_six_months(self.visitors, self.test_duration + self.days, self.percent_traffic_in_test) * self.control_cr * self.aov
+        with np.errstate(divide="ignore"):
+            min_uplift = np.where(revenue_in_six_months > 0, self.min_rev_yield / revenue_in_six_months, np.inf)
+        self.prob_yield = approximate_uplift_probability(*self.log_uplift_moments, min_uplift)
+
+    def calculate_probabilities(self):
+        """Simulates the futures and their probabilities of B being best and of reaching the minimum revenue yield"""
+        self.simulate_futures()
+        self.calculate_yield_probabilities()
+
+    def calculate_plan(self, target_probability, assurance=PLANNING_ASSURANCE):
+        """
+        Chance after each extra day that B reaches the target probability of being best, that either
+        variant does, which decides the test, and that B reaches the target probability of the minimum
+        revenue yield, with the first day each chance is at least the assurance, or None beyond max_days
+        """
+        self.target_probability = target_probability
+        self.assurance = assurance
+        self.plan = {
+            "prob_B": np.mean(self.prob_B >= target_probability, axis=0),
+            "decision": np.mean((self.prob_B >= target_probability) | (1 - self.prob_B >= target_probability), axis=0),
+            "prob_yield": np.mean(self.prob_yield >= target_probability, axis=0),
+        }
+        self.days_needed = {}
+        for name, chance in self.plan.items():
+            reached = np.flatnonzero(chance >= assurance)
+            self.days_needed[name] = int(reached[0]) if reached.size else None
+
+    def visitors_needed(self, name):
+        """Total visitors of the test once it has run the days needed for a plan, or None"""
+        days = self.days_needed[name]
+        return None if days is None else int(self.visitors[days])
+
+    def assurance_chart_data(self):
+        """Data of the chance of B reaching the target probability after each extra day, for the charts drawn in the browser"""
+        days = self.days_needed["prob_B"]
+        data = {
+            "type": "line",
+            "x": self.days.tolist(),
+            "xLabels": [f"+{day}" for day in self.days],
+            "y": chart_values(self.plan["prob_B"]),
+            "color": "#51c4a8",
+            "reference": self.assurance,
+        }
+        if days is not None:
+            data["marker"] = {"x": days, "y": chart_values(self.plan["prob_B"][days]), "color": "#da6d75"}
+        return data
+
+    @instr.timed("plot_assurance")
+    def plot_assurance(self):
+        """
+        Plots the chance of B reaching the target probability of being best after each extra day
+        """
+        mtick, sns = plotting()
+
+        fig, ax = new_figure(figsize=(10, 4))
+        ax.patch.set_alpha(0.8)
+
+        ax.plot(self.days, self.plan["prob_B"], color="#51c4a8", linewidth=2)
+        ax.axhline(self.assurance, color="#da6d75", linestyle="--", linewidth=1)
+        days = self.days_needed["prob_B"]
+        if days is not None:
+            ax.axvline(days, color="#da6d75", linestyle="--", linewidth=1)
+            ax.text(days, self.plan["prob_B"][days], f" +{days} days", color="#595959", **roboto)
+
+        ax.yaxis.grid(color="lightgrey")
+        ax.set_axisbelow(True)
+        sns.despine(ax=ax, left=True)
+        ax.set_ylim(0, 1.05)
+        ax.set_xlim(0, self.max_days)
+        ax.tick_params(axis="y", colors="lightgrey")
+        ax.tick_params(axis='x', colors='#595959')
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter(1))
+        ax.xaxis.set_major_formatter(mtick.FuncFormatter(lambda value, position: f"+{value:.0f}"))
+        fig.tight_layout()
+        return fig
+
+
+def log_value_posterior(orders, log_revenue, log_revenue_squares):
+    """
+    Normal-inverse-gamma posterior of the mean and variance of the log order values, as the mean,
+    weight, shape and scale of LOG_VALUE_PRIOR updated with the sufficient statistics of the orders
+    """
+    prior_mean, prior_weight, prior_shape, prior_scale = LOG_VALUE_PRIOR
+    weight = prior_weight + orders
+    mean_log = log_revenue / orders if orders > 0 else prior_mean
+    squared_deviations = max(log_revenue_squares - orders * mean_log**2, 0)
+    mean = (prior_weight * prior_mean + log_revenue) / weight
+    scale = prior_scale + squared_deviations / 2 + prior_weight * orders * (mean_log - prior_mean)**2 / (2 * weight)
+    return mean, weight, prior_shape + orders / 2, scale
+
+
+"""
+Class for the revenue per visitor of A and B from the sufficient statistics of their orders (see
+order_logs.py), instead of the conversion rate times a fixed AOV. Conversions follow the Beta posterior
+of the orders per visitor and order values a log-normal with a normal-inverse-gamma posterior, so
+differences in the order value of A and B and its uncertainty are part of the result
+"""
+class bayesRevenueCalculations(object):
+    def __init__(self, num_samples=NUM_POSTERIOR_SAMPLES, seed=None, workers=None):
+        self.num_samples = num_samples
+        # Seed of the samples, a fresh one is drawn and recorded in sampling_seed if not set, and
+        # threads drawing them, all the cores if not set
+        self.seed = seed
+        self.workers = workers
+
+    def setValues(self, visitors_A, orders_A, visitors_B, orders_B, test_duration=None, percent_traffic_in_test=100):
+        """
+        Visitors of A and B and dicts with the ORDER_STATISTICS of their orders. The duration and traffic
+        are only needed by the revenue projections, and can be set later with setProjectionValues
+        """
+        for visitors, orders in [(visitors_A, orders_A), (visitors_B, orders_B)]:
+            if orders["orders"] < MIN_REVENUE_ORDERS or orders["orders"] > visitors:
+                raise ValueError(f"Expected at least {MIN_REVENUE_ORDERS} orders of both variants and no more orders than visitors")
+        self.visitors_A = visitors_A
+        self.visitors_B = visitors_B
+        self.orders_A = {name: orders_A[name] for name in ORDER_STATISTICS}
+        self.orders_B = {name: orders_B[name] for name in ORDER_STATISTICS}
+        self.control_aov = self.orders_A["revenue"] / self.orders_A["orders"]
+        self.variant_aov = self.orders_B["revenue"] / self.orders_B["orders"]
+        self.control_rpv = self.orders_A["revenue"] / visitors_A
+        self.variant_rpv = self.orders_B["revenue"] / visitors_B
+        self.relative_difference = self.variant_rpv / self.control_rpv - 1
+        self.setProjectionValues(test_duration, percent_traffic_in_test)
+
+    def setProjectionValues(self, test_duration, percent_traffic_in_test):
+        """Sets the values the revenue projections depend on, which do not change the posteriors"""
+        self.test_duration = test_duration
+        self.percent_traffic_in_test = percent_traffic_in_test
+
+    @instr.timed("revenue_generate_posterior_samples", lambda calc: {
+        "samples": 2 * calc.num_samples,
+        "bytes": instr.array_bytes(calc.samples_posterior_A, calc.samples_posterior_B),
+    })
+    def generate_posterior_samples(self):
+        """
+        Generates samples of the revenue per visitor of A and B, the conversion rate times the mean of
+        the log-normal order value, from the seed or a fresh one recorded in sampling_seed
+        """
+        self.sampling_seed = np.random.SeedSequence(self.seed).entropy
+        alphas, betas, means, weights, shapes, scales = (np.array(values, dtype=float)[:, None] for values in zip(*[
+            (ALPHA_PRIOR + orders["orders"], BETA_PRIOR + visitors - orders["orders"],
+             *log_value_posterior(orders["orders"], orders["log_revenue"], orders["log_revenue_squares"]))
+            for visitors, orders in [(self.visitors_A, self.orders_A), (self.visitors_B, self.orders_B)]
+        ]))
+
+        def draw_block(rng, n):
+            conversion_rates = rng.beta(alphas, betas, (2, n))
+            variances = scales / rng.gamma(shapes, size=(2, n))
+            log_means = rng.normal(means, np.sqrt(variances / weights))
+            return conversion_rates * np.exp(log_means + variances / 2)
+
+        self.samples_posterior_A, self.samples_posterior_B = draw_samples(draw_block, 2, self.num_samples, self.sampling_seed, self.workers)
+
+    def calculate_probabilities(self):
+        """Calculate the likelihood that the variants bring more revenue per visitor"""
+        self.calculate_posterior_probabilities()
+        self.calculate_revenue_projections()
+
+    @instr.timed("revenue_calculate_posterior_probabilities")
+    def calculate_posterior_probabilities(self):
+        """
+        Probabilities of each variant having the highest revenue per visitor and the mean positive and
+        negative relative changes of B over A, which only depend on the visitors and orders. The relative
+        changes are kept sorted for the quantiles
+        """
+        difference = self._sorted_difference = np.sort(self.samples_posterior_B / self.samples_posterior_A - 1)
+        positive = difference > 0
+        self.prob_B = np.mean(positive)
+        self.prob_A = 1 - self.prob_B
+        self.mean_positive_difference = np.mean(difference, where=positive) if self.prob_B > 0 else 0
+        self.mean_negative_difference = np.mean(difference, where=~positive) if self.prob_A > 0 else 0
+        self.standard_error_prob_B = standard_error(self.prob_B, self.num_samples)
+
+    def uplift_quantiles(self, probabilities):
+        """Quantiles of the relative change of B over A"""
+        probabilities = np.asarray(probabilities, dtype=float)
+        return np.interp(probabilities * (len(self._sorted_difference) - 1), np.arange(len(self._sorted_difference)), self._sorted_difference)
+
+    def credible_interval(self, mass=0.95):
+        """Equal-tailed credible interval of the relative change of B over A"""
+        return tuple(self.uplift_quantiles([(1 - mass) / 2, (1 + mass) / 2]))
+
+    def calculate_revenue_projections(self):
+        """Calculate the expected risk, uplift and total contribution in six months"""
+        revenue_in_six_months = self.revenue_in_six_months()
+        self.expected_risk = revenue_in_six_months * self.mean_negative_difference
+        self.expected_uplift = revenue_in_six_months * self.mean_positive_difference
+        self.total_contribution = self.expected_risk * self.prob_A + self.expected_uplift * self.prob_B
 
+    def revenue_in_six_months(self):
+        """Revenue of the control in six months at the traffic and duration of the test"""
+        return visitors_in_six_months(self.visitors_A + self.visitors_B, self.test_duration, self.percent_traffic_in_test) * self.control_rpv
@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+import bayes_calculations as b
+
+# The fonts of the plots are often missing on benchmark machines, which only changes the fallback font
+logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+
+# Total visitors of the benchmarked tests, split evenly between A and B at these conversion rates
+TRAFFIC_SIZES = [200, 10_000, 1_000_000, 50_000_000]
+CONVERSION_RATES = (0.30, 0.32)
+SAMPLE_COUNTS = [100_000, 500_000, 2_000_000]
+REPEAT = 3
+# Concurrent sessions and clicks per session of the end-to-end benchmark
+CONCURRENCY_LEVELS = [1, 4, 16]
+CLICKS = 5
+CLICK_TIMEOUT = 300
+PROJECTION_VALUES = {"test_duration": 14, "percent_traffic_in_test": 100, "aov": 100, "min_rev_yield": 1000}
+
+
+def save_png(fig):
+    """Encodes a figure as the plot outputs do, so rendering is measured up to the PNG sent to the browser"""
+    fig.savefig(io.BytesIO(), format="png", dpi=75)
+
+
+# Stages of the pipeline of one click, in order. Each receives the calculation the previous ones built
+STAGES = [
+    ("generate_posterior_samples", lambda calc: calc.generate_posterior_samples()),
+    ("calculate_posterior_probabilities", lambda calc: calc.calculate_posterior_probabilities()),
+    ("histograms", lambda calc: calc.histograms()),
+    ("calculate_revenue_projections", lambda calc: calc.calculate_revenue_projections()),
+    ("plot_bayesian_probabilities", lambda calc: save_png(calc.plot_bayesian_probabilities())),
+    ("plot_simulation", lambda calc: save_png(calc.plot_simulation())),
+    ("plot_simulation_of_difference", lambda calc: save_png(calc.plot_simulation_of_difference())),
+    ("plot_yield_curve", lambda calc: save_png(calc.plot_yield_curve())),
+    ("chart_data", lambda calc: json.dumps([calc.probabilities_chart_data(), calc.simulation_chart_data(),
+                                             calc.difference_chart_data(), calc.yield_curve_chart_data()])),
+]
+
+
+"""
+Benchmarks of the calculation and rendering pipeline. Every stage of a click is timed for a grid
+of traffic sizes, sample counts and engines, and measured again under tracemalloc for its memory.
+The end-to-end benchmark drives the server() of app.py through headless websocket sessions and
+reports the latency of each click at several concurrency levels, with the websockets package, a
+dependency of shiny that only the benchmark imports itself. Results are printed as JSON
+"""
+def new_calculation(engine, traffic, samples):
+    """Calculation of a test with traffic visitors split between A and B"""
+    calc = b.bayesCalculations(engine) if samples is None else b.bayesCalculations(engine, max_samples=samples)
+    visitors = traffic // 2
+    calc.setValues(visitors, round(visitors * CONVERSION_RATES[0]), visitors, round(visitors * CONVERSION_RATES[1]),
+                   *PROJECTION_VALUES.values())
+    return calc
+
+
+def time_stages(engine, traffic, samples, repeat):
+    """Wall time of every stage over repeat runs of the whole pipeline, in seconds"""
+    times = {name: [] for name, stage in STAGES}
+    for _ in range(repeat):
+        calc = new_calculation(engine, traffic, samples)
+        for name, stage in STAGES:
+            start = time.perf_counter()
+            stage(calc)
+            times[name].append(time.perf_counter() - start)
+    return times
+
+
+def measure_memory(engine, traffic, samples):
+    """
+    Memory of every stage, measured with tracemalloc in a separate run as tracing slows the
+    stages down: the peak allocated above the memory in use when the stage starts, the bytes
+    still allocated when it ends and the net number of blocks it left allocated
+    """
+    memory = {}
+    tracemalloc.start()
+    try:
+        calc = new_calculation(engine, traffic, samples)
+        for name, stage in STAGES:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            stage(calc)
+            end, peak = tracemalloc.get_traced_memory()
+            blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+            memory[name] = {"peak_bytes": peak - start, "retained_bytes": end - start, "allocated_blocks": blocks}
+    finally:
+        tracemalloc.stop()
+    return memory
+
+
+def benchmark_pipeline(engines, traffic_sizes, sample_counts, repeat):
+    """One result per engine, traffic size and sample count, with the time and memory of every stage"""
+    results = []
+    for engine in engines:
+        # The analytic engine draws no samples, so it is run once per traffic size
+        counts = [None] if engine == "analytic" else sample_counts
+        for traffic, samples in itertools.product(traffic_sizes, counts):
+            times = time_stages(engine, traffic, samples, repeat)
+            memory = measure_memory(engine, traffic, samples)
+            stages = {
+                name: dict(min_seconds=min(times[name]), median_seconds=statistics.median(times[name]), **memory[name])
+                for name, stage in STAGES
+            }
+            total = sum(stage["median_seconds"] for stage in stages.values())
+            results.append({"engine": engine, "traffic": traffic, "samples": samples, "total_median_seconds": total, "stages": stages})
+            print(f"{engine:>10} {traffic:>11,} visitors {samples or 0:>10,} samples {total:8.3f}s", file=sys.stderr)
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def click_outputs():
+    """Outputs that every click updates, as rendered with the CHART_RENDERING of the environment"""
+    charts = "chart" if os.environ.get("CHART_RENDERING", "server") == "client" else "plot"
+    return {"main_result_table", "risk_assesment", "yield_curve"} | {f"{charts}_{n}" for n in (1, 2, 3, 5)}
+
+
+async def run_session(url, session, clicks, distinct, expected):
+    """
+    Opens a headless session of the app and clicks Calculate clicks times, returning the seconds from
+    each click until all the expected outputs are received. With distinct, every click uses new test
+    data, so its result is never in the cache
+    """
+    import websockets
+
+    visitors = 5000
+    init = {"visitors_A": visitors, "conversions_A": 1500, "visitors_B": visitors, "conversions_B": 1600,
+            "currency_switch": True, "year_assessment_switch": True, "compute:shiny.action": 0, "num_arms": 2,
+            ".clientdata_pixelratio": 1, **PROJECTION_VALUES}
+    for name in expected | {"main_result", "posterior_simulation", "posterior_simulation_diff"}:
+        init.update({f".clientdata_output_{name}_hidden": False, f".clientdata_output_{name}_width": 750,
+                     f".clientdata_output_{name}_height": 300})
+
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"method": "init", "data": init}))
+        # The initial outputs are complete once the session has been quiet for a moment
+        while True:
+            try:
+                await asyncio.wait_for(ws.recv(), 1)
+            except asyncio.TimeoutError:
+                break
+
+        latencies = []
+        for click in range(1, clicks + 1):
+            update = {"compute:shiny.action": click}
+            if distinct:
+                update["conversions_B"] = 1600 + session * clicks + click
+            start = time.perf_counter()
+            await ws.send(json.dumps({"method": "update", "data": update}))
+            pending = set(expected)
+            while pending:
+                message = json.loads(await asyncio.wait_for(ws.recv(), CLICK_TIMEOUT))
+                pending -= set(message.get("values") or {}) | set(message.get("errors") or {})
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+
+def latency_summary(latencies, elapsed):
+    latencies = np.array(latencies)
+    return {
+        "clicks": len(latencies),
+        "mean_seconds": latencies.mean(),
+        "p50_seconds": np.percentile(latencies, 50),
+        "p95_seconds": np.percentile(latencies, 95),
+        "max_seconds": latencies.max(),
+        "clicks_per_second": len(latencies) / elapsed,
+    }
+
+
+def benchmark_end_to_end(concurrency_levels, clicks, distinct=True):
+    """Starts app.py in a server process and measures the click latency at every concurrency level"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "shiny", "run", "--port", str(port), "app.py"],
+        cwd=Path(__file__).parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), 1).close()
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("The app did not start")
+                time.sleep(0.2)
+
+        url = f"ws://127.0.0.1:{port}/websocket/"
+        expected = click_outputs()
+        results = []
+        offset = 0
+        for level in concurrency_levels:
+            async def run_level():
+                return await asyncio.gather(*[
+                    run_session(url, offset + session, clicks, distinct, expected) for session in range(level)
+                ])
+            start = time.perf_counter()
+            sessions = asyncio.run(run_level())
+            elapsed = time.perf_counter() - start
+            offset += level
+            summary = latency_summary([latency for session in sessions for latency in session], elapsed)
+            results.append({"concurrency": level, "distinct_inputs": distinct, **summary})
+            print(f"{level:>3} sessions p50 {summary['p50_seconds']:.3f}s p95 {summary['p95_seconds']:.3f}s", file=sys.stderr)
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def environment():
+    """Versions the results were measured with, to compare them across versions"""
+    import scipy
+    import shiny
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "matplotlib": matplotlib.__version__,
+        "shiny": shiny.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "chart_rendering": os.environ.get("CHART_RENDERING", "server"),
+    }
+
+
+def json_default(value):
+    """Converts the numpy scalars of the results"""
+    return value.item()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the calculation and rendering pipeline")
+    parser.add_argument("--engines", nargs="+", default=list(b.ENGINES), choices=b.ENGINES)
+    parser.add_argument("--traffic", nargs="+", type=int, default=TRAFFIC_SIZES, help="total visitors of each test")
+    parser.add_argument("--samples", nargs="+", type=int, default=SAMPLE_COUNTS, help="posterior samples of each test")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs of every case")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=CONCURRENCY_LEVELS,
+                        help="concurrent sessions of the end-to-end benchmark, none to skip it")
+    parser.add_argument("--clicks", type=int, default=CLICKS, help="clicks per session")
+    parser.add_argument("--repeat-inputs", action="store_true", help="click with the same test data, served from the cache")
+    parser.add_argument("--output", help="JSON file for the results, printed if not set")
+    args = parser.parse_args(argv)
+
+    results = {
+        "environment": environment(),
+        "pipeline": benchmark_pipeline(args.engines, args.traffic, args.samples, args.repeat),
+        "end_to_end": benchmark_end_to_end(args.concurrency, args.clicks, not args.repeat_inputs) if args.concurrency else [],
+    }
+    document = json.dumps(results, indent=2, default=json_default)
+    if args.output:
+        Path(args.output).write_text(document)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from pathlib import Path
+from shiny import ui
+from shiny.render.renderer import Renderer
+
+js_path = Path(__file__).parent / "www" / "charts.js"
+
+
+"""
+Charts drawn in the browser. Instead of a PNG rendered with matplotlib, the server sends the data
+of the chart as JSON (see the *_chart_data methods of bayesCalculations) and www/charts.js draws it
+as SVG
+"""
+def output_chart(id):
+    """Container of a chart drawn in the browser"""
+    return ui.div(id=id, class_="shiny-chart-output")
+
+
+class render_chart(Renderer[dict]):
+    """Sends the data of a chart to the browser as JSON"""
+    def auto_output_ui(self):
+        return output_chart(self.output_id)
+
+    async def transform(self, value):
+        return value
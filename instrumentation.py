@@ -0,0 +1,123 @@
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+
+# Instrumentation is off unless INSTRUMENTATION=1. When off, every hook is a flag check
+ENABLED = os.environ.get("INSTRUMENTATION", "0") == "1"
+# Upper bounds in seconds of the buckets of the stage duration histograms
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger("calculator.instrumentation")
+# Records of the stages run in the current context, while collect() is active
+collector = ContextVar("collector", default=None)
+
+
+def array_bytes(*arrays):
+    """Bytes held by the numpy arrays, skipping the ones not set"""
+    return int(sum(array.nbytes for array in arrays if isinstance(array, np.ndarray)))
+
+
+"""
+Aggregates of every stage recorded by the process, exposed in the Prometheus text format
+"""
+class metricsRegistry(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def observe(self, record):
+        with self.lock:
+            stage = self.stages.setdefault(record["stage"], {
+                "count": 0, "seconds": 0.0, "samples": 0, "bytes": 0, "buckets": [0] * len(DURATION_BUCKETS),
+            })
+            stage["count"] += 1
+            stage["seconds"] += record["seconds"]
+            stage["samples"] += record.get("samples", 0)
+            stage["bytes"] += record.get("bytes", 0)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if record["seconds"] <= bound:
+                    stage["buckets"][i] += 1
+
+    def prometheus_text(self):
+        """Durations as cumulative histograms and the sample and byte totals of every stage"""
+        lines = [
+            "# HELP calculator_stage_seconds Duration of the stages of the calculator",
+            "# TYPE calculator_stage_seconds histogram",
+        ]
+        with self.lock:
+            stages = {name: dict(stage, buckets=list(stage["buckets"])) for name, stage in self.stages.items()}
+        for name, stage in sorted(stages.items()):
+            for bound, count in zip(DURATION_BUCKETS, stage["buckets"]):
+                lines.append(f'calculator_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'calculator_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage["count"]}')
+            lines.append(f'calculator_stage_seconds_sum{{stage="{name}"}} {stage["seconds"]}')
+            lines.append(f'calculator_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        for metric, description in [("samples", "Posterior samples drawn"), ("bytes", "Bytes of the arrays produced")]:
+            lines += [f"# HELP calculator_stage_{metric}_total {description} by the stages of the calculator",
+                      f"# TYPE calculator_stage_{metric}_total counter"]
+            lines += [f'calculator_stage_{metric}_total{{stage="{name}"}} {stage[metric]}' for name, stage in sorted(stages.items())]
+        return "\n".join(lines) + "\n"
+
+
+metrics = metricsRegistry()
+
+
+def record(stage, seconds, **details):
+    """Logs a stage, adds it to the metrics and to the records being collected"""
+    entry = {"stage": stage, "seconds": seconds, **details}
+    logger.info("%s took %.4fs", stage, seconds, extra={"instrumentation": entry})
+    metrics.observe(entry)
+    records = collector.get()
+    if records is not None:
+        records.append(entry)
+
+
+@contextmanager
+def stage(name, **details):
+    """
+    Times the block as a stage. The block can add details, as samples or bytes, to the yielded dict.
+    Yields None when instrumentation is off
+    """
+    if not ENABLED:
+        yield None
+        return
+    start = time.perf_counter()
+    try:
+        yield details
+    finally:
+        record(name, time.perf_counter() - start, **details)
+
+
+def timed(name, details=None):
+    """
+    Decorator that times a method as a stage. details(self) returns the sample count, array bytes or
+    any other detail to record once the method has run
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not ENABLED:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            record(name, time.perf_counter() - start, **(details(self) if details else {}))
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect():
+    """Collects the records of the stages run in the block, also in nested calls, into the yielded list"""
+    records = []
+    token = collector.set(records)
+    try:
+        yield records
+    finally:
+        collector.reset(token)
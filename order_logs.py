@@ -0,0 +1,95 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import bayes_calculations as b
+
+# Columns of an order log: the variant the order belongs to and its revenue
+ARM_COLUMN = "variant"
+VALUE_COLUMN = "revenue"
+# Orders read at a time, which bounds the memory of a pass over the log
+CHUNK_SIZE = 1_000_000
+
+
+"""
+Reduction of order logs to the sufficient statistics of the revenue engine. The log, a CSV or
+Parquet file with one row per order, is read in chunks in a single pass and only the count, sum
+and sums of logs and squared logs of the order values of every variant are kept, so logs of hundreds
+of millions of orders never need to fit in memory
+"""
+def read_orders(path, columns, chunk_size=CHUNK_SIZE):
+    """Reads the columns of the order log in chunks of rows"""
+    if Path(path).suffix == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+
+
+def order_statistics(path, arm_column=ARM_COLUMN, value_column=VALUE_COLUMN, chunk_size=CHUNK_SIZE):
+    """
+    The ORDER_STATISTICS of every variant of the order log, in a dict by variant. Each chunk is
+    reduced with one bincount per statistic, so a pass costs a few array operations per order
+    """
+    totals = {}
+    for chunk in read_orders(path, [arm_column, value_column], chunk_size):
+        values = chunk[value_column].to_numpy(dtype=float)
+        if not np.all(values > 0):
+            raise ValueError(f"Expected positive order values in the column {value_column}")
+        if chunk[arm_column].isna().any():
+            raise ValueError(f"Expected the variant of every order in the column {arm_column}")
+        codes, arms = pd.factorize(chunk[arm_column].astype(str))
+        log_values = np.log(values)
+        sums = np.stack([np.bincount(codes, weights=weights, minlength=len(arms))
+                         for weights in (None, values, log_values, log_values**2)], axis=1)
+        for arm, row in zip(arms, sums):
+            totals[arm] = totals.get(arm, 0) + row
+    return {arm: dict(zip(b.ORDER_STATISTICS, [int(row[0]), *row[1:].tolist()])) for arm, row in totals.items()}
+
+
+def evaluate_order_log(path, visitors_A, visitors_B, test_duration, percent_traffic_in_test=100, arms=("A", "B"),
+                       arm_column=ARM_COLUMN, value_column=VALUE_COLUMN, chunk_size=CHUNK_SIZE, seed=None):
+    """Revenue per visitor result of the variants arms of the order log, with the visitors of each"""
+    statistics = order_statistics(path, arm_column, value_column, chunk_size)
+    missing = [arm for arm in arms if arm not in statistics]
+    if missing:
+        raise ValueError(f"No orders of the variants {missing} in the column {arm_column}")
+    calc = b.bayesRevenueCalculations(seed=seed)
+    calc.setValues(visitors_A, statistics[arms[0]], visitors_B, statistics[arms[1]], test_duration, percent_traffic_in_test)
+    calc.generate_posterior_samples()
+    calc.calculate_probabilities()
+    return calc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the revenue per visitor of A and B from an order log")
+    parser.add_argument("input", help=f"CSV or Parquet file with one row per order and the columns {ARM_COLUMN} and {VALUE_COLUMN}")
+    parser.add_argument("--visitors-A", type=int, required=True, help="visitors of A, with or without an order")
+    parser.add_argument("--visitors-B", type=int, required=True, help="visitors of B, with or without an order")
+    parser.add_argument("--test-duration", type=float, required=True, help="days of the test")
+    parser.add_argument("--percent-traffic", type=float, default=100, help="percentage of the traffic in the test")
+    parser.add_argument("--arms", nargs=2, default=["A", "B"], help="labels of the control and the variant in the log")
+    parser.add_argument("--arm-column", default=ARM_COLUMN)
+    parser.add_argument("--value-column", default=VALUE_COLUMN)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="orders read at a time")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the posterior samples, for reproducible results")
+    args = parser.parse_args(argv)
+
+    try:
+        calc = evaluate_order_log(args.input, args.visitors_A, args.visitors_B, args.test_duration, args.percent_traffic,
+                                  args.arms, args.arm_column, args.value_column, args.chunk_size, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    result = {name: getattr(calc, name) for name in [
+        "orders_A", "orders_B", "control_aov", "variant_aov", "control_rpv", "variant_rpv", "relative_difference",
+        "prob_A", "prob_B", "expected_risk", "expected_uplift", "total_contribution", "sampling_seed",
+    ]}
+    result["credible_interval"] = calc.credible_interval()
+    print(json.dumps(result, indent=2, default=lambda value: value.item() if isinstance(value, np.generic) else str(value)))
+
+
+if __name__ == "__main__":
+    main()
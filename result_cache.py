@@ -0,0 +1,129 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+# Bumped whenever the cached states change, so entries written by an older version are never read
+CACHE_VERSION = 2
+# Defaults of the in-process tier budget and of the entries kept by the on-disk tier
+MEMORY_BUDGET = 256 * 2**20
+DISK_MAX_ENTRIES = 10000
+
+
+def canonical(value):
+    """Converts inputs to plain JSON values, so 5000, 5000.0 and np.int64(5000) give the same key"""
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (bool, np.bool_)) or value is None or isinstance(value, str):
+        return value
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def cache_key(*inputs):
+    """Content address of the inputs of a calculation: a hash of their canonical JSON"""
+    document = json.dumps([CACHE_VERSION, canonical(list(inputs))], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(document.encode()).hexdigest()
+
+
+"""
+Cache of calculation results addressed by the hash of their inputs. The in-process tier keeps the
+most recently used results under a memory budget and the optional on-disk tier, a SQLite file,
+is shared by all the worker processes and survives their restarts. Values are stored pickled, so
+every reader gets its own copy and the budget counts their actual size
+"""
+class resultCache(object):
+    def __init__(self, memory_budget=MEMORY_BUDGET, path=None, disk_max_entries=DISK_MAX_ENTRIES):
+        self.memory_budget = memory_budget
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        if path is not None:
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB, accessed REAL)"
+                )
+
+    @contextmanager
+    def _connect(self):
+        """A connection per call, so threads and processes never share one"""
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key):
+        """Returns the value stored for key, or None, looking in memory first and then on disk"""
+        with self.lock:
+            blob = self.memory.get(key)
+            if blob is not None:
+                self.memory.move_to_end(key)
+        if blob is None and self.path is not None:
+            with self._connect() as connection:
+                row = connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    blob = row[0]
+                    connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            if blob is not None:
+                self._remember(key, blob)
+        with self.lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, value):
+        """Stores value in memory and, with a path, on disk, evicting the least recently used entries"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, blob, time.time()))
+                connection.execute(
+                    "DELETE FROM results WHERE key NOT IN (SELECT key FROM results ORDER BY accessed DESC LIMIT ?)",
+                    (self.disk_max_entries,),
+                )
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value of key, computing and storing it when missing"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key, blob):
+        """Adds a pickled value to the in-process tier, unless it alone exceeds the budget"""
+        if len(blob) > self.memory_budget:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_size -= len(self.memory.pop(key))
+            self.memory[key] = blob
+            self.memory_size += len(blob)
+            while self.memory_size > self.memory_budget:
+                self.memory_size -= len(self.memory.popitem(last=False)[1])
+
+    def clear(self):
+        """Empties both tiers"""
+        with self.lock:
+            self.memory.clear()
+            self.memory_size = 0
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM results")
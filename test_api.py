@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+import api
+
+EXPERIMENT = {"visitors_A": 5000, "conversions_A": 1500, "visitors_B": 5000, "conversions_B": 1600,
+              "test_duration": 14, "percent_traffic_in_test": 100, "aov": 100, "min_rev_yield": 1000}
+
+
+@pytest.mark.parametrize("name, value, message", [
+    ("visitors_A", True, r"numbers for \['visitors_A'\]"),
+    ("aov", "100", r"numbers for \['aov'\]"),
+    ("conversions_A", float("nan"), r"finite numbers for \['conversions_A'\]"),
+    ("conversions_B", 1600.5, r"whole numbers for \['conversions_B'\]"),
+    ("conversions_A", 5001, "no more than the visitors"),
+])
+def test_validate_rejects(name, value, message):
+    with pytest.raises(ValueError, match=message):
+        api.validate({**EXPERIMENT, name: value})
+
+
+def test_validate_accepts_whole_floats_and_numpy_numbers():
+    values = api.validate({**EXPERIMENT, "visitors_A": 5000.0, "conversions_A": np.int64(1500)})
+    assert values["visitors_A"] == 5000 and values["conversions_A"] == 1500
+
+
+def test_evaluate_experiments_reports_each_invalid_experiment():
+    results = api.evaluate_experiments([EXPERIMENT, {**EXPERIMENT, "visitors_B": False}, {**EXPERIMENT, "conversions_A": 0}])
+    assert 0.98 < results[0]["prob_B"] < 0.99
+    assert "visitors_B" in results[1]["error"]
+    assert results[2]["relative_difference"] is None and results[2]["prob_yield_mean"] == 0
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+import batch_evaluation as be
+import bayes_calculations as b
+
+EXPERIMENTS = pd.DataFrame([
+    [5000, 1500, 5000, 1600, 14, 100, 100, 1000],
+    [1000, 1200, 1000, 300, 14, 100, 100, 1000],
+    [1000, np.nan, 1000, 300, 14, 100, 100, 1000],
+    [1000, 0, 1000, 5, 14, 100, 100, 1000],
+], columns=be.INPUT_COLUMNS)
+
+
+@pytest.mark.parametrize("engine", b.ENGINES)
+def test_invalid_rows_get_an_error(engine):
+    evaluated = be.evaluate_experiments(EXPERIMENTS, engine, seed=7)
+    assert list(evaluated["error"] != "") == [False, True, True, False]
+    assert evaluated.loc[[1, 2], be.RESULT_COLUMNS].isna().all(axis=None)
+    assert evaluated.loc[3, "prob_B"] > 0.95
+
+
+def test_analytic_rows_match_bayes_calculations():
+    calc = b.bayesCalculations()
+    calc.setValues(*EXPERIMENTS.iloc[0])
+    calc.calculate_probabilities()
+    evaluated = be.evaluate_experiments(EXPERIMENTS.iloc[:1])
+    np.testing.assert_allclose(evaluated.loc[0, be.RESULT_COLUMNS].to_numpy(dtype=float),
+                               [getattr(calc, column) for column in be.RESULT_COLUMNS])
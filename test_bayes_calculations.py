@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+import bayes_calculations as b
+
+DAILY = {
+    "visitors_A": [1000, 1200, 900],
+    "conversions_A": [300, 350, 280],
+    "visitors_B": [1000, 1100, 950],
+    "conversions_B": [320, 360, 310],
+}
+
+
+def sequential(days):
+    calc = b.bayesSequentialCalculations()
+    calc.setValues(*[values[:days] for values in DAILY.values()], 100, 100)
+    return calc
+
+
+def test_sequential_append_matches_a_full_calculation():
+    appended = sequential(2)
+    appended.calculate_probabilities()
+    appended.append(*[values[2] for values in DAILY.values()])
+    full = sequential(3)
+    full.calculate_probabilities()
+    for name, values in full.timeline().items():
+        np.testing.assert_allclose(appended.timeline()[name], values)
+
+
+def test_sequential_recalculation_after_append():
+    calc = sequential(2)
+    calc.calculate_probabilities()
+    calc.append(*[values[2] for values in DAILY.values()])
+    appended = calc.timeline()
+    calc.setProjectionValues(50, 100)
+    calc.calculate_probabilities()
+    timeline = calc.timeline()
+    assert len(timeline["prob_B"]) == 3
+    np.testing.assert_allclose(timeline["prob_B"], appended["prob_B"])
+    np.testing.assert_allclose(timeline["expected_uplift"], 2 * appended["expected_uplift"])
+
+
+def test_sequential_append_before_calculation():
+    calc = sequential(2)
+    calc.append(*[values[2] for values in DAILY.values()])
+    full = sequential(3)
+    full.calculate_probabilities()
+    np.testing.assert_allclose(calc.timeline()["prob_B"], full.timeline()["prob_B"])
+
+
+def test_sequential_rejects_more_conversions_than_visitors():
+    calc = sequential(2)
+    with pytest.raises(ValueError):
+        calc.append(10, 11, 10, 5)
+
+
+@pytest.mark.parametrize("engine", b.STREAMED_ENGINES)
+def test_streamed_engines_need_no_generated_samples(engine):
+    calc = b.bayesCalculations(engine, max_samples=20000, seed=7)
+    calc.setValues(5000, 1500, 5000, 1600, 14, 100, 100, 1000)
+    calc.calculate_probabilities()
+    sampled = b.bayesCalculations(engine, max_samples=20000, seed=7)
+    sampled.setValues(5000, 1500, 5000, 1600, 14, 100, 100, 1000)
+    sampled.generate_posterior_samples()
+    sampled.calculate_probabilities()
+    assert calc.sampling_seed == 7
+    assert calc.prob_B == sampled.prob_B
+
+
+def test_revenue_credible_interval():
+    orders = {"orders": 100, "revenue": 10000.0, "log_revenue": 100 * np.log(100), "log_revenue_squares": 100 * np.log(100)**2 + 25}
+    calc = b.bayesRevenueCalculations(num_samples=20000, seed=7)
+    calc.setValues(1000, orders, 1000, orders)
+    calc.generate_posterior_samples()
+    calc.calculate_posterior_probabilities()
+    difference = calc.samples_posterior_B / calc.samples_posterior_A - 1
+    np.testing.assert_allclose(calc.credible_interval(0.9), np.quantile(difference, [0.05, 0.95]))
+
+
+# Visitors and conversions of A and B and a minimum revenue yield near the expected uplift: a balanced
+# test, a small one with few conversions and one of 50M visitors with a tiny relative change
+GROUND_TRUTH_CASES = [
+    (5000, 1500, 5000, 1600, 270_000),
+    (100, 3, 100, 8, 15_000),
+    (25_000_000, 7_500_000, 25_000_000, 7_505_000, 14_000_000),
+]
+
+
+@pytest.mark.parametrize("case", GROUND_TRUTH_CASES)
+def test_analytic_engine_matches_a_large_montecarlo_run(case):
+    calcs = {}
+    for engine in ("analytic", "montecarlo"):
+        calcs[engine] = calc = b.bayesCalculations(engine, max_samples=2_000_000, seed=7)
+        calc.setValues(*case[:4], 14, 100, 100, case[4])
+        calc.generate_posterior_samples()
+        calc.calculate_probabilities()
+    analytic, sampled = calcs["analytic"], calcs["montecarlo"]
+    assert abs(analytic.prob_B - sampled.prob_B) < 4 * sampled.standard_error_prob_B
+    assert abs(analytic.prob_yield_mean - sampled.prob_yield_mean) < 4 * sampled.standard_error_prob_yield
+    for name, differences in (("mean_positive_difference", sampled.greater), ("mean_negative_difference", sampled.lower)):
+        standard_error = differences.std() / np.sqrt(differences.size)
+        assert abs(getattr(analytic, name) - getattr(sampled, name)) < 4 * standard_error, name
+    # The sampled differences fall below the ends of the analytic interval as often as its tails say
+    difference = sampled.samples_posterior_B / sampled.samples_posterior_A - 1
+    for tail, end in zip((0.025, 0.975), analytic.credible_interval(0.95)):
+        assert abs((difference <= end).mean() - tail) < 4 * b.standard_error(tail, difference.size)
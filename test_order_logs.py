@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+import order_logs as ol
+
+
+def test_order_statistics(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_text("variant,revenue\nA,10\nB,20\nA,30\n")
+    statistics = ol.order_statistics(path, chunk_size=2)
+    assert statistics["A"]["orders"] == 2 and statistics["A"]["revenue"] == 40
+    np.testing.assert_allclose(statistics["A"]["log_revenue_squares"], np.log(10)**2 + np.log(30)**2)
+    assert statistics["B"]["orders"] == 1
+
+
+def test_order_statistics_rejects_orders_without_a_variant(tmp_path):
+    path = tmp_path / "orders.csv"
+    path.write_text("variant,revenue\nA,10\n,20\nB,30\n")
+    with pytest.raises(ValueError, match="column variant"):
+        ol.order_statistics(path)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import bayes_calculations as b
+import result_cache as rc
+
+VALUES = (5000, 1500, 5000, 1600, 14, 100, 100, 100_000)
+
+
+def calculation(engine, seed=7):
+    calc = b.bayesCalculations(engine, max_samples=20000, seed=seed)
+    calc.setValues(*VALUES)
+    return calc
+
+
+def test_cache_key_is_the_same_for_equal_numbers():
+    keys = {rc.cache_key({"counts": [visitors, 1500]}) for visitors in (5000, 5000.0, np.int64(5000))}
+    assert len(keys) == 1
+
+
+def test_cache_key_differs_between_seeds_and_engines():
+    inputs = [calculation(engine, seed).cache_inputs() for engine, seed in [("montecarlo", 7), ("montecarlo", 8), ("streaming", 7)]]
+    assert len({rc.cache_key("bayesCalculations", values) for values in inputs}) == 3
+
+
+def test_memory_tier_evicts_the_least_recently_used_within_its_budget():
+    cache = rc.resultCache(memory_budget=3000)
+    for key in "abc":
+        cache.put(key, bytes(900))
+    cache.get("a")
+    cache.put("d", bytes(900))
+    assert cache.memory_size <= 3000
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+
+
+def test_memory_tier_skips_values_over_its_budget():
+    cache = rc.resultCache(memory_budget=1000)
+    cache.put("a", bytes(2000))
+    assert cache.get("a") is None and cache.memory_size == 0
+
+
+@pytest.mark.parametrize("engine", b.ENGINES)
+def test_restored_posterior_state_reproduces_the_results(engine):
+    calc = calculation(engine)
+    calc.generate_posterior_samples()
+    calc.calculate_probabilities()
+    cache = rc.resultCache()
+    key = rc.cache_key("bayesCalculations", calc.cache_inputs())
+    cache.put(key, calc.posterior_state())
+    restored = calculation(engine)
+    restored.restore_posterior_state(cache.get(rc.cache_key("bayesCalculations", restored.cache_inputs())))
+    restored.calculate_revenue_projections()
+    assert restored.prob_B == calc.prob_B
+    assert restored.prob_yield_mean == calc.prob_yield_mean
+    np.testing.assert_allclose(restored.credible_interval(), calc.credible_interval())
+
+
+def test_disk_tier_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    rc.resultCache(path=path).put("key", {"prob_B": 0.98})
+    cache = rc.resultCache(path=path)
+    assert cache.get("key") == {"prob_B": 0.98}
+    assert cache.hits == 1
@@ -0,0 +1,199 @@
+/*!
+ * Charts drawn in the browser from the JSON data sent by the server (client_charts.py)
+ */
+(function () {
+  var SVG_NS = "http://www.w3.org/2000/svg";
+  var MARGIN = { top: 10, right: 20, bottom: 30, left: 50 };
+
+  function element(name, attributes, parent) {
+    var node = document.createElementNS(SVG_NS, name);
+    for (var key in attributes) {
+      node.setAttribute(key, attributes[key]);
+    }
+    if (parent) {
+      parent.appendChild(node);
+    }
+    return node;
+  }
+
+  function text(parent, x, y, content, attributes) {
+    var node = element("text", Object.assign({ x: x, y: y }, attributes || {}), parent);
+    node.textContent = content;
+    return node;
+  }
+
+  // Round tick positions covering [min, max]
+  function ticks(min, max, count) {
+    var step = Math.pow(10, Math.floor(Math.log10((max - min) / count || 1)));
+    var error = (max - min) / count / step;
+    step *= error >= 5 ? 10 : error >= 2 ? 5 : error >= 1.5 ? 2 : 1;
+    var values = [];
+    for (var value = Math.ceil(min / step) * step; value <= max + step * 1e-9; value += step) {
+      values.push(Math.abs(value) < step * 1e-9 ? 0 : value);
+    }
+    return { values: values, step: step };
+  }
+
+  function percent(value, step) {
+    var digits = Math.max(0, Math.min(2, -Math.floor(Math.log10(step * 100))));
+    return (value * 100).toFixed(digits) + "%";
+  }
+
+  function amount(value, currency) {
+    return currency + Math.round(value).toLocaleString("en-US");
+  }
+
+  function scale(domainMin, domainMax, rangeMin, rangeMax) {
+    return function (value) {
+      return rangeMin + (value - domainMin) / (domainMax - domainMin || 1) * (rangeMax - rangeMin);
+    };
+  }
+
+  function grid(svg, values, position, from, to, horizontal) {
+    values.forEach(function (value) {
+      var p = position(value);
+      element("line", horizontal ?
+        { x1: from, x2: to, y1: p, y2: p, class: "chart-grid" } :
+        { x1: p, x2: p, y1: from, y2: to, class: "chart-grid" }, svg);
+    });
+  }
+
+  // Horizontal bars of the chance of each variant being the best
+  function drawBars(svg, data, width, height) {
+    var left = 30;
+    var x = scale(0, 1, left, width - MARGIN.right);
+    var xTicks = ticks(0, 1, 5);
+    var band = (height - MARGIN.bottom) / data.labels.length;
+    grid(svg, xTicks.values, x, 0, height - MARGIN.bottom, false);
+    xTicks.values.forEach(function (value) {
+      text(svg, x(value), height - 10, percent(value, xTicks.step), { class: "chart-tick", "text-anchor": "middle" });
+    });
+    data.labels.forEach(function (label, i) {
+      var value = data.values[i];
+      var y = i * band + band * 0.1;
+      element("rect", { x: x(0), y: y, width: x(value) - x(0), height: band * 0.8, fill: data.colors[i] }, svg);
+      text(svg, left - 8, y + band * 0.45, label, { class: "chart-tick", "text-anchor": "end", "dominant-baseline": "middle" });
+      var inside = value >= 0.2;
+      text(svg, x(value) + (inside ? -6 : 6), y + band * 0.45, (value * 100).toFixed(1) + "%", {
+        class: inside ? "chart-label chart-label-inside" : "chart-label",
+        "text-anchor": inside ? "end" : "start",
+        "dominant-baseline": "middle"
+      });
+    });
+  }
+
+  // Histograms from precomputed bin edges and fractions
+  function drawHistogram(svg, data, width, height) {
+    var bottom = height - MARGIN.bottom - (data.legend ? 30 : 0);
+    var series = data.series.filter(function (s) { return s.values.length > 0; });
+    var xMin = Math.min.apply(null, series.map(function (s) { return s.edges[0]; }));
+    var xMax = Math.max.apply(null, series.map(function (s) { return s.edges[s.edges.length - 1]; }));
+    var yMax = Math.max.apply(null, series.map(function (s) { return Math.max.apply(null, s.values); }));
+    var x = scale(xMin, xMax, MARGIN.left, width - MARGIN.right);
+    var y = scale(0, yMax * 1.05, bottom, MARGIN.top);
+    var xTicks = ticks(xMin, xMax, 8);
+    var yTicks = ticks(0, yMax * 1.05, 5);
+
+    grid(svg, yTicks.values, y, MARGIN.left, width - MARGIN.right, true);
+    yTicks.values.forEach(function (value) {
+      text(svg, MARGIN.left - 8, y(value), percent(value, yTicks.step), { class: "chart-tick chart-tick-dim", "text-anchor": "end", "dominant-baseline": "middle" });
+    });
+    xTicks.values.forEach(function (value) {
+      text(svg, x(value), bottom + 18, percent(value, xTicks.step), { class: "chart-tick", "text-anchor": "middle" });
+    });
+    element("line", { x1: MARGIN.left, x2: width - MARGIN.right, y1: bottom, y2: bottom, class: "chart-axis" }, svg);
+
+    series.forEach(function (s) {
+      s.values.forEach(function (value, i) {
+        var x0 = x(s.edges[i]);
+        var binWidth = x(s.edges[i + 1]) - x0;
+        element("rect", {
+          x: x0 + binWidth * 0.125, y: y(value), width: binWidth * 0.75, height: bottom - y(value),
+          fill: s.color, class: "chart-bar"
+        }, svg);
+      });
+    });
+
+    if (data.legend) {
+      var itemWidth = 160;
+      var start = width / 2 - itemWidth * series.length / 2;
+      series.forEach(function (s, i) {
+        element("rect", { x: start + i * itemWidth, y: height - 22, width: 12, height: 12, fill: s.color, class: "chart-bar" }, svg);
+        text(svg, start + i * itemWidth + 18, height - 12, s.label, { class: "chart-tick" });
+      });
+    }
+  }
+
+  // Line chart of the chance of reaching each minimum revenue yield, or of a probability over time
+  // when the points have labels
+  function drawLine(svg, data, width, height) {
+    var left = MARGIN.left + 20;
+    var bottom = height - MARGIN.bottom;
+    var xMax = data.x[data.x.length - 1];
+    var x = scale(0, xMax, left, width - MARGIN.right);
+    var y = scale(0, 1.05, bottom, MARGIN.top);
+    var yTicks = ticks(0, 1, 5);
+
+    grid(svg, yTicks.values, y, left, width - MARGIN.right, true);
+    yTicks.values.forEach(function (value) {
+      text(svg, left - 8, y(value), percent(value, yTicks.step), { class: "chart-tick chart-tick-dim", "text-anchor": "end", "dominant-baseline": "middle" });
+    });
+    if (data.xLabels) {
+      var every = Math.max(1, Math.ceil(data.xLabels.length / 8));
+      data.xLabels.forEach(function (label, i) {
+        if (i % every === 0) {
+          text(svg, x(data.x[i]), bottom + 18, label, { class: "chart-tick", "text-anchor": "middle" });
+        }
+      });
+    } else {
+      ticks(0, xMax, 6).values.forEach(function (value) {
+        text(svg, x(value), bottom + 18, amount(value, data.currency), { class: "chart-tick", "text-anchor": "middle" });
+      });
+    }
+    element("line", { x1: left, x2: width - MARGIN.right, y1: bottom, y2: bottom, class: "chart-axis" }, svg);
+
+    if (data.reference !== undefined) {
+      element("line", { x1: left, x2: width - MARGIN.right, y1: y(data.reference), y2: y(data.reference), stroke: "#da6d75", class: "chart-marker" }, svg);
+    }
+    var points = data.x.map(function (value, i) { return x(value) + "," + y(data.y[i]); }).join(" ");
+    element("polyline", { points: points, fill: "none", stroke: data.color, "stroke-width": 2 }, svg);
+    if (data.marker) {
+      element("line", { x1: x(data.marker.x), x2: x(data.marker.x), y1: MARGIN.top, y2: bottom, stroke: data.marker.color, class: "chart-marker" }, svg);
+      text(svg, x(data.marker.x) + 4, y(data.marker.y), (data.marker.y * 100).toFixed(1) + "%", { class: "chart-label" });
+    }
+  }
+
+  var draw = { bars: drawBars, histogram: drawHistogram, line: drawLine };
+
+  function render(el) {
+    var data = el._chartData;
+    el.innerHTML = "";
+    if (!data) {
+      return;
+    }
+    var width = el.clientWidth || 750;
+    var height = el.clientHeight || 300;
+    var svg = element("svg", { width: width, height: height, class: "chart" }, el);
+    draw[data.type](svg, data, width, height);
+  }
+
+  var binding = new Shiny.OutputBinding();
+  $.extend(binding, {
+    find: function (scope) {
+      return $(scope).find(".shiny-chart-output");
+    },
+    renderValue: function (el, data) {
+      el._chartData = data;
+      render(el);
+    }
+  });
+  Shiny.outputBindings.register(binding, "calculator.chart");
+
+  var resizeTimer = null;
+  window.addEventListener("resize", function () {
+    clearTimeout(resizeTimer);
+    resizeTimer = setTimeout(function () {
+      document.querySelectorAll(".shiny-chart-output").forEach(render);
+    }, 100);
+  });
+})();